@@ -0,0 +1,116 @@
+import threading
+from dataclasses import dataclass
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from back.models.models import VotingSession
+from back import invalidation
+
+
+@dataclass(frozen=True)
+class ActiveSession:
+    """Read-only copy of the active VotingSession row."""
+    id: int
+    name: str
+    description: str | None
+    active: bool
+    stage: int
+
+    @classmethod
+    def from_session(cls, session: VotingSession):
+        return cls(
+            id=session.id,
+            name=session.name,
+            description=session.description,
+            active=session.active,
+            stage=session.stage
+        )
+
+
+class ActiveSessionCache:
+    """
+    The active session only changes on start_session, end_session, delete_session and
+    stage advances, so it is read once and kept until one of those writers invalidates it.
+    "No active session" is cached as well.
+    """
+
+    def __init__(self):
+        self._loaded = False
+        self._session: ActiveSession | None = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, db: Session) -> ActiveSession | None:
+        with self._lock:
+            if self._loaded:
+                return self._session
+            generation = self._generation
+        # With several committees voting at once, the unscoped routes address the oldest
+        row = db.query(VotingSession).filter_by(active=True).order_by(VotingSession.id).first()
+        session = ActiveSession.from_session(row) if row else None
+        with self._lock:
+            if generation == self._generation:
+                self._session, self._loaded = session, True
+        return session
+
+    def invalidate(self, key=None):
+        with self._lock:
+            self._generation += 1
+            self._session, self._loaded = None, False
+
+
+class SessionCache:
+    """
+    Sessions by id, for the session-scoped routes. Invalidated together with the
+    active session, by the same writers.
+    """
+
+    def __init__(self):
+        self._sessions: dict[int, ActiveSession | None] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, session_id: int) -> ActiveSession | None:
+        with self._lock:
+            if session_id in self._sessions:
+                return self._sessions[session_id]
+            generation = self._generation
+        row = db.get(VotingSession, session_id)
+        session = ActiveSession.from_session(row) if row else None
+        with self._lock:
+            if generation == self._generation:
+                self._sessions[session_id] = session
+        return session
+
+    def invalidate(self, key=None):
+        with self._lock:
+            self._generation += 1
+            self._sessions.clear()
+
+
+active_sessions = ActiveSessionCache()
+sessions = SessionCache()
+invalidation.register("session", active_sessions.invalidate)
+invalidation.register("session", sessions.invalidate)
+
+
+def get_active_session(db: Session) -> ActiveSession:
+    """
+    The active session, or a 400 if there is none.
+    """
+    session = active_sessions.get(db)
+    if not session:
+        raise HTTPException(status_code=400, detail="No active voting session")
+    return session
+
+
+def get_session(db: Session, session_id: int | None) -> ActiveSession:
+    """
+    The session a route addresses: the one in its path, or the active session for
+    the unscoped /voting routes. A 404 if there is no such session.
+    """
+    if session_id is None:
+        return get_active_session(db)
+    session = sessions.get(db, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Voting session not found")
+    return session
@@ -0,0 +1,150 @@
+from datetime import datetime
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+from back.models.models import Candidate, Finalist, SessionCandidate, SessionResult, SessionStats, StageProgress, VotingSession
+from back.scopes import eligible_voters
+from back import engine, progress, queries
+
+# Summaries of ended sessions, one row per session and per session and candidate,
+# written in the transaction that ends the session. The /analytics routes read only
+# these, so they cost the same however many votes the history holds.
+
+# Ended sessions, most recently ended first. Sessions run side by side, so ids
+# do not follow the order they ended in.
+_newest_first = (SessionStats.ended_at.desc(), SessionStats.session_id.desc())
+
+
+def summarize(db: Session, session: VotingSession):
+    """
+    Write the summary rows of a session, replacing any it had, from its tallies,
+    finalists and stage progress. Does not commit.
+    """
+    # A session summarized again keeps the time it ended
+    ended_at = db.query(SessionStats.ended_at).filter_by(session_id=session.id).scalar() or datetime.utcnow()
+    db.query(SessionResult).filter_by(session_id=session.id).delete(synchronize_session=False)
+    db.query(SessionStats).filter_by(session_id=session.id).delete(synchronize_session=False)
+
+    stage_points = queries.session_points(db, session.id)
+    # Everyone who got votes, plus the rest of an explicit ballot
+    candidate_ids = {candidate_id for points in stage_points.values() for candidate_id in points}
+    candidate_ids.update(c for (c,) in db.query(SessionCandidate.candidate_id).filter_by(session_id=session.id))
+    finalists = {c for (c,) in db.query(Finalist.candidate_id).filter_by(session_id=session.id, stage=2)}
+    winner_id = None
+    if session.stage >= 3:
+        winner_id = engine.winner(engine.rank(stage_points.get(2, {})), stage_points.get(3, {}))
+
+    def placing(candidate_id):
+        return (candidate_id == winner_id, stage_points.get(2, {}).get(candidate_id, 0), stage_points.get(1, {}).get(candidate_id, 0))
+
+    results, rank, previous = [], 0, None
+    for position, candidate_id in enumerate(sorted(candidate_ids, key=placing, reverse=True), start=1):
+        if placing(candidate_id) != previous:
+            rank, previous = position, placing(candidate_id)
+        results.append(SessionResult(
+            session_id=session.id,
+            candidate_id=candidate_id,
+            stage1_points=stage_points.get(1, {}).get(candidate_id, 0),
+            stage2_points=stage_points.get(2, {}).get(candidate_id, 0),
+            total_points=sum(points.get(candidate_id, 0) for points in stage_points.values()),
+            rank=rank,
+            finalist=candidate_id in finalists,
+            winner=candidate_id == winner_id
+        ))
+    db.add_all(results)
+
+    completed = dict(db.query(StageProgress.stage, StageProgress.completed).filter_by(session_id=session.id))
+    for stage in (1, 2):
+        # Sessions from before stage progress was tracked
+        if stage not in completed and session.stage >= stage:
+            completed[stage] = progress.count_completed(db, session.id, stage)
+    db.add(SessionStats(
+        session_id=session.id,
+        eligible_voters=eligible_voters(db, session.id),
+        stage1_voters=completed.get(1, 0),
+        stage2_voters=completed.get(2, 0),
+        candidates=len(results),
+        winner_id=winner_id,
+        ended_at=ended_at
+    ))
+
+
+def summarize_ended_sessions(db: Session) -> int:
+    """
+    Summarize every ended session again, e.g. those that ended before summaries
+    existed, which are taken to end now, in id order.
+    """
+    sessions = db.query(VotingSession).filter_by(active=False).order_by(VotingSession.id).all()
+    for session in sessions:
+        summarize(db, session)
+    db.commit()
+    return len(sessions)
+
+
+def candidate_history(db: Session, candidate_id: int, limit: int) -> list[dict]:
+    """How a candidate did in the last `limit` ended sessions it was part of, newest first."""
+    rows = db.query(SessionResult, VotingSession.name).join(
+        VotingSession, VotingSession.id == SessionResult.session_id
+    ).join(SessionStats, SessionStats.session_id == SessionResult.session_id).filter(
+        SessionResult.candidate_id == candidate_id
+    ).order_by(*_newest_first).limit(limit).all()
+    return [{
+        "session_id": result.session_id,
+        "session_name": name,
+        "stage1_points": result.stage1_points,
+        "stage2_points": result.stage2_points,
+        "total_points": result.total_points,
+        "rank": result.rank,
+        "finalist": result.finalist,
+        "winner": result.winner
+    } for result, name in rows]
+
+
+def participation(db: Session, limit: int) -> list[dict]:
+    """Turnout of the last `limit` ended sessions, newest first."""
+    rows = db.query(SessionStats, VotingSession.name).join(
+        VotingSession, VotingSession.id == SessionStats.session_id
+    ).order_by(*_newest_first).limit(limit).all()
+    return [{
+        "session_id": stats.session_id,
+        "session_name": name,
+        "eligible_voters": stats.eligible_voters,
+        "stage1_voters": stats.stage1_voters,
+        "stage2_voters": stats.stage2_voters,
+        "stage1_rate": round(stats.stage1_voters / stats.eligible_voters, 4) if stats.eligible_voters else None,
+        "stage2_rate": round(stats.stage2_voters / stats.eligible_voters, 4) if stats.eligible_voters else None,
+        "winner_id": stats.winner_id
+    } for stats, name in rows]
+
+
+def leaderboard(db: Session, sessions: int | None, limit: int) -> list[dict]:
+    """
+    Candidates by wins, then finalist places, then points, over the last `sessions`
+    ended sessions (all of them when None).
+    """
+    query = db.query(
+        SessionResult.candidate_id,
+        Candidate.name,
+        func.count().label("sessions"),
+        func.sum(case((SessionResult.winner, 1), else_=0)).label("wins"),
+        func.sum(case((SessionResult.finalist, 1), else_=0)).label("finalist"),
+        func.sum(SessionResult.total_points).label("points"),
+        func.avg(SessionResult.rank).label("average_rank")
+    ).join(Candidate, Candidate.id == SessionResult.candidate_id)
+    if sessions is not None:
+        recent = db.query(SessionStats.session_id).order_by(*_newest_first).limit(sessions)
+        query = query.filter(SessionResult.session_id.in_([session_id for (session_id,) in recent]))
+    rows = query.group_by(SessionResult.candidate_id, Candidate.name).order_by(
+        func.sum(case((SessionResult.winner, 1), else_=0)).desc(),
+        func.sum(case((SessionResult.finalist, 1), else_=0)).desc(),
+        func.sum(SessionResult.total_points).desc(),
+        SessionResult.candidate_id
+    ).limit(limit).all()
+    return [{
+        "candidate_id": row.candidate_id,
+        "name": row.name,
+        "sessions": row.sessions,
+        "wins": int(row.wins),
+        "finalist": int(row.finalist),
+        "points": int(row.points or 0),
+        "average_rank": round(float(row.average_rank), 2)
+    } for row in rows]
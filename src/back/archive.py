@@ -0,0 +1,48 @@
+from fastapi import HTTPException
+from sqlalchemy import Engine, exists, insert, select
+from sqlalchemy.orm import Session
+from back.config import USE_TALLY_TABLE
+from back.models.models import ArchivedVote, Vote, VotingSession
+from back import tally
+
+
+def archive_session(db: Session, session_id: int) -> int:
+    """
+    Move the votes of an ended session to `archived_votes`. Its tallies are rebuilt
+    first, as the results of the session are read from them from then on. Returns
+    the number of votes moved.
+    """
+    tally.rebuild(db, session_id)
+    columns = [Vote.id, Vote.user_id, Vote.candidate_id, Vote.session_id, Vote.stage, Vote.points]
+    db.execute(insert(ArchivedVote).from_select(
+        [ArchivedVote.id, ArchivedVote.user_id, ArchivedVote.candidate_id, ArchivedVote.session_id, ArchivedVote.stage, ArchivedVote.points],
+        select(*columns).where(Vote.session_id == session_id)
+    ))
+    moved = db.query(Vote).filter_by(session_id=session_id).delete(synchronize_session=False)
+    db.commit()
+    return moved
+
+
+def archive_ended_sessions(db: Session) -> dict:
+    """
+    Archive the votes of every ended session that still has some in `votes`, one
+    session per transaction.
+    """
+    if not USE_TALLY_TABLE:
+        raise HTTPException(status_code=400, detail="Archiving needs USE_TALLY_TABLE, archived sessions' results are read from the tallies")
+    session_ids = db.scalars(select(VotingSession.id).where(
+        VotingSession.active.is_(False),
+        exists().where(Vote.session_id == VotingSession.id)
+    ).order_by(VotingSession.id)).all()
+    votes = sum(archive_session(db, session_id) for session_id in session_ids)
+    return {"sessions": len(session_ids), "votes": votes}
+
+
+def compact(engine: Engine):
+    """
+    Give the space freed in `votes` back to the database: VACUUM on SQLite, and
+    VACUUM ANALYZE of the votes table on Postgres. Both run outside a transaction.
+    """
+    statement = "VACUUM" if engine.dialect.name == "sqlite" else "VACUUM ANALYZE votes"
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.exec_driver_sql(statement)
@@ -1,22 +1,19 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
-from back.config import SECRET_KEY, ALGORITHM
-from back.database.database import get_db
+from back.config import SECRET_KEY, ALGORITHM, AUTH_CACHE_SIZE, AUTH_CACHE_TTL
+from back.database.database import AsyncDB, get_async_db
 from back.models.models import User
-from sqlalchemy.orm import Session
+from back.auth.cache import TokenCache, UserSnapshot
+from back.auth.hashing import verify_password, verify_password_async
+from back import invalidation
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+token_cache = TokenCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+invalidation.register("user", token_cache.invalidate_user)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -33,7 +30,21 @@ def authenticate_user(db, username: str, password: str):
         return False
     return user
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def authenticate_user_async(db, username: str, password: str):
+    """
+    Same as authenticate_user, but the bcrypt check runs in the hashing process pool.
+    """
+    user = await run_in_threadpool(get_user, db, username)
+    if not user or not await verify_password_async(password, user.hashed_password):
+        return False
+    return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncDB = Depends(get_async_db)) -> UserSnapshot:
+    # Repeat requests with the same token skip both the signature check and the user query
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+
     credentials_exception = HTTPException(status_code=401, detail="Invalid credentials")
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -42,7 +53,9 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = get_user(db, username=username)
+    user = await db.run(get_user, username)
     if user is None:
         raise credentials_exception
-    return user 
\ No newline at end of file
+    snapshot = UserSnapshot.from_user(user)
+    token_cache.put(token, snapshot, payload["exp"])
+    return snapshot 
\ No newline at end of file
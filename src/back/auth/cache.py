@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """Read-only copy of the User fields the routes need, safe to share across requests."""
+    id: int
+    username: str
+    is_president: bool
+    is_admin: bool
+    photo: str | None = None
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(
+            id=user.id,
+            username=user.username,
+            is_president=bool(user.is_president),
+            is_admin=bool(user.is_admin),
+            photo=user.photo
+        )
+
+
+class TokenCache:
+    """
+    Bounded LRU of bearer token -> UserSnapshot. Entries expire after `ttl` seconds
+    or when the token itself expires, whichever comes first.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, UserSnapshot]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> UserSnapshot | None:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, token: str, user: UserSnapshot, token_expires_at: float):
+        expires_at = min(time.time() + self.ttl, token_expires_at)
+        with self._lock:
+            self._entries[token] = (expires_at, user)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, username: str | None = None):
+        """
+        Drop the cached tokens of one user, or of every user when username is None.
+        """
+        with self._lock:
+            if username is None:
+                self._entries.clear()
+                return
+            for token in [t for t, (_, user) in self._entries.items() if user.username == username]:
+                del self._entries[token]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
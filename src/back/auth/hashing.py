@@ -0,0 +1,61 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from passlib.context import CryptContext
+from back.config import HASH_WORKERS
+
+# bcrypt is deliberately slow (~250ms of CPU per call). Running it in a process pool
+# keeps it off the event loop and out of the request thread pool, and lets a login
+# burst use every core instead of contending for the GIL.
+# This module is imported by the pool's worker processes, so keep it free of app imports.
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def get_password_hash(password):
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def warm_up():
+    """Load the bcrypt backend, which passlib otherwise does on the first hash."""
+    pwd_context.handler("bcrypt").get_backend()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned, not forked: a fork of a uvicorn worker would copy its event
+            # loop, threads and pooled connections into every hashing process
+            _pool = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_pool():
+    """Stop the hashing processes, waiting for them to exit so none outlive the worker."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            # Queued hashes are dropped; a running one (~250ms) is let finish
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_pool(), verify_password, plain_password, hashed_password)
+
+
+def hash_passwords(passwords: list[str]) -> list[str]:
+    """
+    Hash many passwords in parallel across the pool, preserving order.
+    """
+    return list(get_pool().map(get_password_hash, passwords))
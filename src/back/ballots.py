@@ -0,0 +1,117 @@
+from dataclasses import dataclass
+from fastapi import HTTPException
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from back.active_session import ActiveSession, get_session
+from back.auth.cache import UserSnapshot
+from back.models.models import Candidate, Vote
+from back.scopes import eligible_voters, scopes
+from back import progress, tally
+
+# The checks and the write behind a vote or ballot, shared by the per-request path
+# in routers/voting.py and the group commit in ingest.py.
+
+
+@dataclass
+class Ballot:
+    """Votes of one request, checked and ready to be written."""
+    session_id: int
+    stage: int
+    user_id: int
+    candidate_ids: list[int]
+    points: list[int]
+    completes: bool  # these are the user's last votes in the stage
+
+
+def check_session(db: Session, session_id: int | None, stage: int, current_user: UserSnapshot) -> ActiveSession:
+    current_session = get_session(db, session_id)
+    if not current_session.active:
+        raise HTTPException(status_code=400, detail="This voting session has ended")
+
+    if stage not in [1, 2, 3]:
+        raise HTTPException(status_code=400, detail="Invalid stage")
+
+    scope = scopes.get(db, current_session.id)
+    if scope.voter_ids is not None and current_user.id not in scope.voter_ids:
+        raise HTTPException(status_code=403, detail="You are not a voter in this session")
+    return current_session
+
+
+def check_votes(candidate_ids: list[int], votes_remaining: int):
+    if votes_remaining <= 0:
+        raise HTTPException(status_code=400, detail="You have already cast all your votes for this stage")
+    if len(candidate_ids) > votes_remaining:
+        raise HTTPException(status_code=400, detail=f"You only have {votes_remaining} votes left in this stage")
+    if len(set(candidate_ids)) != len(candidate_ids):
+        raise HTTPException(status_code=400, detail="You cannot vote for the same candidate twice")
+
+
+def check_candidates(db: Session, session_id: int, candidate_ids: list[int], known: frozenset[int] | None = None):
+    """
+    404 unless every candidate exists and is on the session's ballot. `known` is
+    a cached set of every candidate id, to check against instead of the database.
+    """
+    # Primary key lookups: the snapshot is invalidated by every vote, so rebuilding
+    # it here would cost a full recompute per vote.
+    scope = scopes.get(db, session_id)
+    if scope.candidate_ids is not None:
+        found = scope.candidate_ids.issuperset(candidate_ids)
+    elif known is not None:
+        found = known.issuperset(candidate_ids)
+    elif len(candidate_ids) == 1:
+        found = db.get(Candidate, candidate_ids[0]) is not None
+    else:
+        found = db.query(Candidate).filter(Candidate.id.in_(candidate_ids)).count() == len(candidate_ids)
+    if not found:
+        raise HTTPException(status_code=404, detail="Candidate not found")
+
+
+def record(db: Session, ballots: list[Ballot]) -> list[bool]:
+    """
+    Write the votes of `ballots` with one executemany, add them to the tallies and,
+    for ballots that finish a user's stage, count the user as done and advance the
+    session once everyone is. Returns whether each ballot advanced its session.
+    Does not commit. The unique indexes on votes raise IntegrityError for a second
+    vote for the same candidate, or a concurrent request that computed the same points.
+    """
+    db.execute(insert(Vote), [{
+        "user_id": ballot.user_id,
+        "candidate_id": candidate_id,
+        "stage": ballot.stage,
+        "session_id": ballot.session_id,
+        "points": candidate_points
+    } for ballot in ballots for candidate_id, candidate_points in zip(ballot.candidate_ids, ballot.points)])
+
+    points: dict[tuple[int, int, int], int] = {}
+    for ballot in ballots:
+        for candidate_id, candidate_points in zip(ballot.candidate_ids, ballot.points):
+            key = (ballot.session_id, ballot.stage, candidate_id)
+            points[key] = points.get(key, 0) + candidate_points
+    for (session_id, stage, candidate_id), candidate_points in points.items():
+        tally.add_points(db, session_id, stage, candidate_id, candidate_points)
+
+    # One counter update per stage for the whole batch: a counter seeded from the
+    # votes already includes every ballot written above
+    completing: dict[tuple[int, int], list[int]] = {}
+    for i, ballot in enumerate(ballots):
+        if ballot.completes:
+            completing.setdefault((ballot.session_id, ballot.stage), []).append(i)
+    advanced = [False] * len(ballots)
+    for (session_id, stage), indexes in completing.items():
+        completed = progress.complete_user(db, session_id, stage, len(indexes))
+        if completed >= eligible_voters(db, session_id):
+            advanced[indexes[-1]] = progress.advance_stage(db, session_id, stage)
+    return advanced
+
+
+def conflict(db: Session, ballot: Ballot) -> HTTPException:
+    """The error for a ballot whose votes the unique indexes rejected."""
+    existing_vote = db.query(Vote.id).filter(
+        Vote.user_id == ballot.user_id,
+        Vote.candidate_id.in_(ballot.candidate_ids),
+        Vote.stage == ballot.stage,
+        Vote.session_id == ballot.session_id
+    ).first()
+    if existing_vote:
+        return HTTPException(status_code=400, detail="You have already voted for this candidate in this stage")
+    return HTTPException(status_code=409, detail="Another vote of yours was recorded at the same time, please try again")
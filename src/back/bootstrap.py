@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import threading
+from back.auth.hashing import get_pool, warm_up as warm_up_hashing
+from back.config import ASYNC_DB, DB_POOL_SIZE, DB_POOL_WARM, HASH_WORKERS
+from back.database.database import Base, SessionLocal, async_engine, engine
+from back.models.models import Tally, User, Vote, VotingSession
+from back.active_session import active_sessions
+from back.scopes import scopes
+from back.snapshot import snapshots
+from back import tally
+
+logger = logging.getLogger("uvicorn.error")
+
+class Readiness:
+    """Whether this worker has finished starting up, and is not shutting down."""
+
+    def __init__(self):
+        self.ready = False
+        self.startup_seconds: float | None = None
+
+
+readiness = Readiness()
+
+_done = False
+_lock = threading.Lock()
+
+
+def migrate():
+    """
+    Create missing tables, and the indexes create_all skips on tables that
+    already exist. Fills the tallies of a database upgraded from before them.
+    """
+    Base.metadata.create_all(bind=engine)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    with SessionLocal() as db:
+        if db.query(Tally.id).first() is None and db.query(Vote.id).first() is not None:
+            logger.info("Computing the vote tallies from the existing votes")
+            tally.rebuild(db)
+
+
+def ensure_admin():
+    with SessionLocal() as db:
+        if not db.query(User).filter_by(is_admin=True).first():
+            User.add_admin("admin", "1234")
+
+
+def bootstrap():
+    """
+    The one-time database setup, run at most once per process: by `fcrvote
+    migrate`, by `fcrvote serve` before it starts the workers, or by a worker's
+    startup when BOOTSTRAP_ON_STARTUP is on.
+    """
+    global _done
+    with _lock:
+        if not _done:
+            migrate()
+            ensure_admin()
+            _done = True
+
+
+def _warm_pool():
+    connections = [engine.connect() for _ in range(min(DB_POOL_WARM, DB_POOL_SIZE))]
+    for connection in connections:
+        connection.close()
+
+
+async def _warm_async_pool():
+    async def connect():
+        async with async_engine.connect():
+            pass
+    await asyncio.gather(*(connect() for _ in range(min(DB_POOL_WARM, DB_POOL_SIZE))))
+
+
+def _warm_caches():
+    with SessionLocal() as db:
+        active_sessions.get(db)
+        for session in db.query(VotingSession).filter_by(active=True):
+            scopes.get(db, session.id)
+            snapshots.get(db, session)
+
+
+async def warm_up():
+    """
+    Open pool connections, load the active sessions' caches and start the
+    password hashing processes, so a worker's first requests do not pay for them.
+    """
+    await asyncio.to_thread(_warm_pool)
+    if ASYNC_DB:
+        await _warm_async_pool()
+    await asyncio.to_thread(_warm_caches)
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(get_pool(), warm_up_hashing) for _ in range(HASH_WORKERS)))
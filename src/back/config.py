@@ -7,6 +7,54 @@ ENV = os.getenv("ENV", "development")
 SECRET_KEY = "your-secret-key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "4096"))  # tokens kept decoded in memory
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "60"))  # seconds
 
 # Database
-SQLALCHEMY_DATABASE_URL = os.getenv("SQLALCHEMY_DATABASE_URL", "sqlite:///./voting.db")
\ No newline at end of file
+SQLALCHEMY_DATABASE_URL = os.getenv("SQLALCHEMY_DATABASE_URL", "sqlite:///./voting.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))  # connections kept open per worker
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))  # extra connections allowed at peak
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds before a connection is replaced
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # ms a writer waits for the lock
+# Serve the voting routes from an async engine (needs the "async" extra: aiosqlite / asyncpg)
+ASYNC_DB = os.getenv("ASYNC_DB", "false").lower() == "true"
+
+# Create missing tables and the default admin when a worker starts. `fcrvote serve`
+# does it once before starting its workers and turns it off for them.
+BOOTSTRAP_ON_STARTUP = os.getenv("BOOTSTRAP_ON_STARTUP", "true").lower() == "true"
+DB_POOL_WARM = int(os.getenv("DB_POOL_WARM", "4"))  # connections opened before a worker is ready
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))  # uvicorn processes started by `fcrvote serve`
+# bcrypt processes per uvicorn worker; by default the workers share the cores between them
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(max(1, (os.cpu_count() or 1) // WEB_WORKERS))))
+
+# Responses smaller than this many bytes are sent uncompressed
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
+
+# Add a Server-Timing header (SQL statements, database time, slowest statement's time) to every response
+SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() == "true"
+
+# Group commit: votes are queued and written together, one transaction per batch.
+# A batch is whatever queued while the previous one committed, plus what arrives
+# within VOTE_BATCH_WINDOW_MS of its first vote, up to VOTE_BATCH_MAX requests.
+VOTE_GROUP_COMMIT = os.getenv("VOTE_GROUP_COMMIT", "false").lower() == "true"
+VOTE_BATCH_WINDOW_MS = float(os.getenv("VOTE_BATCH_WINDOW_MS", "2"))
+VOTE_BATCH_MAX = int(os.getenv("VOTE_BATCH_MAX", "500"))
+
+# Keep running per-stage tallies instead of summing the votes table on every read
+USE_TALLY_TABLE = os.getenv("USE_TALLY_TABLE", "true").lower() == "true"
+
+# Admin lists (users, candidates, sessions) are paged by id: default and largest page sizes
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "100"))
+ADMIN_MAX_PAGE_SIZE = int(os.getenv("ADMIN_MAX_PAGE_SIZE", "1000"))
+
+# Rows fetched per round trip when streaming exports (server-side cursor on Postgres)
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# Frontend build served in production, see back/static.py
+FRONTEND_BUILD_DIR = os.getenv("FRONTEND_BUILD_DIR", "/home/front")
+
+# Media
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "256"))
+MEDIA_CACHE_SIZE = int(os.getenv("MEDIA_CACHE_SIZE", "64"))  # photos kept decoded in memory
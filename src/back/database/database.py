@@ -1,19 +1,212 @@
-from sqlalchemy import create_engine
+import asyncio
+import time
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from back.config import ENV, SQLALCHEMY_DATABASE_URL
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from back.config import (
+    SQLALCHEMY_DATABASE_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    SQLITE_BUSY_TIMEOUT,
+    ASYNC_DB,
+)
 
-if ENV == "production":
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
-else:
-    engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+# Drivers used for the async engine, by dialect
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+class PoolMetrics:
+    """
+    Mixin for queue pools that records how many checkouts they served, how long those
+    waited for a connection and how many gave up, to size DB_POOL_SIZE / DB_MAX_OVERFLOW.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.checked_out_peak = 0
+
+    # The counters are updated without a lock: the async pool runs on the event loop,
+    # where a greenlet switch while holding a threading.Lock would block the loop, and
+    # an occasionally lost increment is fine for sizing purposes.
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            self.checked_out_peak = max(self.checked_out_peak, self.checkedout())
+
+    def recreate(self):
+        # Called on dispose(); keep the counters across the new pool
+        pool = super().recreate()
+        pool.checkouts, pool.timeouts = self.checkouts, self.timeouts
+        pool.wait_total, pool.wait_max = self.wait_total, self.wait_max
+        pool.checked_out_peak = self.checked_out_peak
+        return pool
+
+    def stats(self) -> dict:
+        checkouts = self.checkouts
+        return {
+            "size": self.size(),
+            "max_overflow": self._max_overflow,
+            "checked_out": self.checkedout(),
+            "checked_out_peak": self.checked_out_peak,
+            "idle": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "checkouts": checkouts,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": round(1000 * self.wait_total / checkouts, 3) if checkouts else 0.0,
+            "wait_max_ms": round(1000 * self.wait_max, 3),
+        }
+
+
+class MeteredQueuePool(PoolMetrics, QueuePool):
+    pass
+
+
+class MeteredAsyncQueuePool(PoolMetrics, AsyncAdaptedQueuePool):
+    pass
+
+
+def _engine_args(url, poolclass) -> dict:
+    args = {}
+    if url.get_backend_name() == "sqlite":
+        if poolclass is MeteredQueuePool:
+            # Requests are served from a threadpool, so connections move between threads
+            args["connect_args"] = {"check_same_thread": False}
+        if url.database in (None, "", ":memory:"):
+            # In-memory databases live and die with their single connection
+            return args
+    return {
+        **args,
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers carry on while a vote is being written, synchronous=NORMAL
+    # only fsyncs at checkpoints, and busy_timeout makes concurrent writers queue
+    # for the lock instead of failing with "database is locked".
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    cursor.close()
+
+
+url = make_url(SQLALCHEMY_DATABASE_URL)
+engine = create_engine(url, **_engine_args(url, MeteredQueuePool))
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _set_sqlite_pragmas)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+async_engine = None
+AsyncSessionLocal = None
+if ASYNC_DB:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_url = url.set(drivername=f"{url.get_backend_name()}+{ASYNC_DRIVERS[url.get_backend_name()]}")
+    async_engine = create_async_engine(async_url, **_engine_args(async_url, MeteredAsyncQueuePool))
+    if async_engine.dialect.name == "sqlite":
+        event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def pool_stats() -> dict:
+    """
+    Utilization of the connection pools of this worker.
+    """
+    stats = {}
+    for name, pool in (("sync", engine.pool), ("async", async_engine and async_engine.sync_engine.pool)):
+        if isinstance(pool, PoolMetrics):
+            stats[name] = pool.stats()
+        elif pool is not None:
+            stats[name] = {"status": pool.status()}
+    return stats
+
+
+# SQLite has a single writer. On the async engine a write transaction spans several
+# event loop turns, so under load writers would outwait SQLITE_BUSY_TIMEOUT in SQLite's
+# busy handler; they queue on this lock instead.
+_sqlite_writer = asyncio.Lock() if ASYNC_DB and url.get_backend_name() == "sqlite" else None
+
+
+class AsyncDB:
+    """
+    Database handle for async routes. `await db.run(fn, *args)` calls fn(session, *args)
+    with a regular Session, so the queries, tally and snapshot helpers are shared with
+    the sync code. With ASYNC_DB the session runs on the async engine and no thread is
+    held while waiting on the database; otherwise fn runs in Starlette's threadpool.
+    Use `db.write()` for functions that write.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    async def run(self, fn, *args, **kwargs):
+        if ASYNC_DB:
+            return await self.session.run_sync(fn, *args, **kwargs)
+        return await run_in_threadpool(fn, self.session, *args, **kwargs)
+
+    async def write(self, fn, *args, **kwargs):
+        if _sqlite_writer is None:
+            return await self.run(fn, *args, **kwargs)
+        if self.session.in_transaction():
+            # Hand back the connection of any reads made so far (e.g. the user lookup
+            # in get_current_user), or queued writers would hold the whole pool
+            await self.session.rollback()
+        async with _sqlite_writer:
+            return await self.run(fn, *args, **kwargs)
+
+    async def close(self):
+        if ASYNC_DB:
+            await self.session.close()
+        elif self.session.in_transaction():
+            # Returning the connection rolls it back, which may wait on the database
+            await run_in_threadpool(self.session.close)
+        else:
+            self.session.close()
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close() 
+
+
+def open_async_db() -> AsyncDB:
+    return AsyncDB(AsyncSessionLocal() if ASYNC_DB else SessionLocal())
+
+
+async def get_async_db():
+    db = open_async_db()
+    try:
+        yield db
+    finally:
+        await db.close()
@@ -0,0 +1,141 @@
+from dataclasses import dataclass
+
+# NumPy is optional (the "analysis" extra) and imported on first use by
+# require_numpy(), so the app does not load it for rules it applies to dicts
+np = None
+
+# The scoring rules of an election. The pure Python functions work on the
+# {candidate_id: points} dicts the app reads from the tallies. The NumPy ones
+# score whole arrays of votes, of one session or of many simulated ones, in a
+# single pass, and agree with the pure Python ones.
+
+# Stage 1 points, best first: each voter ranks three candidates
+STAGE1_POINTS = (3, 2, 1)
+# score() indexes candidates by id below this, and sorts the ids above it
+DENSE_IDS = 1 << 20
+
+
+def rank(points: dict[int, int]) -> list[tuple[int, int]]:
+    """(candidate_id, points), best first. Ties keep the order of `points`."""
+    return sorted(points.items(), key=lambda x: x[1], reverse=True)
+
+
+def qualify(points: dict[int, int]) -> list[int]:
+    """
+    Candidates who go through to the next stage: the top candidate plus second
+    place, or everyone tied for second place.
+    """
+    sorted_results = rank(points)
+
+    # Get top 2 candidates, or 3 if there's a tie for second place
+    top_candidates = []
+    if len(sorted_results) >= 2:
+        top_candidates = [sorted_results[0][0]]  # First place
+        if len(sorted_results) >= 3 and sorted_results[1][1] == sorted_results[2][1]:
+            # If there's a tie for second place, include all tied candidates
+            second_place_points = sorted_results[1][1]
+            for candidate_id, points in sorted_results[1:]:
+                if points == second_place_points:
+                    top_candidates.append(candidate_id)
+                else:
+                    break
+        else:
+            top_candidates.append(sorted_results[1][0])  # Second place
+    return top_candidates
+
+
+def is_tie(ranking: list[tuple[int, int]]) -> bool:
+    """Whether the first two of a stage 2 ranking are level, so the president decides."""
+    return len(ranking) >= 2 and ranking[0][1] == ranking[1][1]
+
+
+def winner(ranking: list[tuple[int, int]], tiebreak: dict[int, int]) -> int | None:
+    """
+    The top of the stage 2 ranking or, on a tie, the president's stage 3 pick.
+    None when there are no stage 2 votes or the tie is not resolved yet.
+    """
+    if not ranking:
+        return None
+    if is_tie(ranking):
+        return next(iter(tiebreak), None)
+    return ranking[0][0]
+
+
+def require_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise RuntimeError("The vectorized tally engine needs NumPy (pip install fcrvote[analysis])") from None
+        np = numpy
+
+
+def qualify_mask(points: "np.ndarray") -> "np.ndarray":
+    """
+    qualify() over the last axis of a points array: True for the candidates who
+    go through. A candidate with no points has received no votes. Whatever the
+    order of tied candidates, qualify() picks those level with the leader plus
+    those level with second place, once at least two candidates have votes.
+    """
+    require_numpy()
+    ordered = -np.sort(-points, axis=-1)
+    first = ordered[..., :1]
+    second = ordered[..., 1:2] if points.shape[-1] > 1 else np.zeros_like(first)
+    contested = np.count_nonzero(points, axis=-1)[..., None] >= 2
+    return contested & (points > 0) & ((points == first) | (points == second))
+
+
+def tie_mask(points: "np.ndarray") -> "np.ndarray":
+    """is_tie() over the last axis of a stage 2 points array."""
+    require_numpy()
+    if points.shape[-1] < 2:
+        return np.zeros(points.shape[:-1], dtype=bool)
+    top = -np.partition(-points, 1, axis=-1)[..., :2]
+    return (top[..., 1] > 0) & (top[..., 0] == top[..., 1])
+
+
+@dataclass
+class Scores:
+    """Outcome of one session, computed from its votes by score()."""
+    candidate_ids: "np.ndarray"
+    stage_points: "np.ndarray"  # (3, candidates): points per stage
+    finalists: dict[int, list[int]]  # stage -> candidate ids who qualified for it
+    is_tie: bool
+    winner: int | None
+
+    def points(self, stage: int) -> dict[int, int]:
+        row = self.stage_points[stage - 1]
+        return {int(self.candidate_ids[i]): int(row[i]) for i in np.flatnonzero(row)}
+
+
+def score(stages, candidate_ids, points) -> Scores:
+    """
+    Score a session from parallel arrays of its votes' stage, candidate id and
+    points (as read from the votes table, in any order).
+    """
+    require_numpy()
+    stages = np.asarray(stages, dtype=np.int64)
+    candidate_ids = np.asarray(candidate_ids, dtype=np.int64)
+    weights = np.asarray(points, dtype=np.float64)
+    if len(candidate_ids) and 0 <= candidate_ids.min() and candidate_ids.max() < DENSE_IDS:
+        # Primary keys are small: count by id directly rather than sorting the votes
+        columns = int(candidate_ids.max()) + 1
+        counted = np.bincount((stages - 1) * columns + candidate_ids, weights=weights, minlength=3 * columns)
+        counted = counted[:3 * columns].reshape(3, columns)
+        ids = np.flatnonzero(counted.any(axis=0))
+        stage_points = counted[:, ids].astype(np.int64)
+    else:
+        ids, index = np.unique(candidate_ids, return_inverse=True)
+        counted = np.bincount((stages - 1) * len(ids) + index, weights=weights, minlength=3 * len(ids))
+        stage_points = counted[:3 * len(ids)].astype(np.int64).reshape(3, len(ids))
+
+    finalists = {stage: ids[qualify_mask(stage_points[stage - 2])].tolist() for stage in (2, 3)}
+    tie = bool(tie_mask(stage_points[1]))
+    winner_id = None
+    if stage_points[1].any():
+        if not tie:
+            winner_id = int(ids[np.argmax(stage_points[1])])
+        elif stage_points[2].any():
+            winner_id = int(ids[np.argmax(stage_points[2])])
+    return Scores(ids, stage_points, finalists, tie, winner_id)
@@ -0,0 +1,65 @@
+import asyncio
+import json
+import threading
+from back import invalidation
+
+# Maximum number of undelivered events kept per connection. A client that falls
+# further behind loses the oldest events; they only ever trigger a refresh anyway.
+QUEUE_SIZE = 100
+
+
+class Broadcaster:
+    """
+    Fan-out of voting events to every connected /voting/stream client.
+
+    publish() relays the event through the invalidation channel, so on Postgres
+    the clients of every worker get it, not only those of the worker that made
+    the change. deliver() runs on the invalidation listener's thread for events
+    from other workers, so events are handed to each subscriber's event loop with
+    call_soon_threadsafe instead of touching the asyncio queues directly.
+    """
+
+    def __init__(self):
+        self._subscribers: dict[asyncio.Queue, asyncio.AbstractEventLoop] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    async def publish(self, event: dict):
+        await invalidation.publish_async("event", event)
+
+    def deliver(self, event: dict | None):
+        if event is None:
+            # The listener reconnected and drops everything, there is no event to pass on
+            return
+        data = json.dumps(event, separators=(",", ":"))
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, data)
+            except RuntimeError:
+                # The subscriber's loop is already closed
+                self.unsubscribe(queue)
+
+    @staticmethod
+    def _put(queue: asyncio.Queue, data: str):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(data)
+
+    @property
+    def connections(self) -> int:
+        return len(self._subscribers)
+
+
+broadcaster = Broadcaster()
+invalidation.register("event", broadcaster.deliver)
@@ -0,0 +1,118 @@
+import csv
+import io
+import json
+from typing import Iterator
+from sqlalchemy import select
+from back.config import EXPORT_BATCH_SIZE
+from back.database.database import SessionLocal
+from back.models.models import ArchivedVote, Candidate, Finalist, User, Vote, VotingSession
+from back.snapshot import compute_snapshot
+from back import queries
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, without it the stdlib json module is used
+    orjson = None
+
+# Exports are generators that open their own database session: they keep reading
+# after the route returns, when the request's session is already closed. Rows are
+# fetched EXPORT_BATCH_SIZE at a time (a server-side cursor on Postgres) and every
+# batch is encoded and sent before the next one is read, so memory stays flat
+# however long the history is.
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _votes(db, session: VotingSession) -> Iterator[list[dict]]:
+    # Archived votes are older than any left in the hot table
+    for table in (ArchivedVote, Vote):
+        statement = select(
+            table.id.label("vote_id"),
+            table.session_id,
+            table.stage,
+            table.user_id,
+            User.username,
+            table.candidate_id,
+            table.points
+        ).outerjoin(User, User.id == table.user_id).where(
+            table.session_id == session.id
+        ).order_by(table.id)
+        result = db.execute(statement, execution_options={"yield_per": EXPORT_BATCH_SIZE})
+        for batch in result.mappings().partitions():
+            yield [dict(row) for row in batch]
+
+
+def _tallies(db, session: VotingSession) -> Iterator[list[dict]]:
+    # One row per stage and candidate, read the same way as the results endpoints
+    names = dict(db.query(Candidate.id, Candidate.name).all())
+    yield [
+        {"session_id": session.id, "stage": stage, "candidate_id": candidate_id, "name": names.get(candidate_id), "points": points}
+        for stage, points_by_candidate in sorted(queries.session_points(db, session.id).items())
+        for candidate_id, points in points_by_candidate.items()
+    ]
+
+
+def _winners(db, session: VotingSession) -> Iterator[list[dict]]:
+    # Who qualified out of stages 1 and 2, then the winner once voting is complete
+    snapshot = compute_snapshot(db, session)
+    rows = []
+    for finalist in db.query(Finalist).filter_by(session_id=session.id).order_by(Finalist.stage, Finalist.candidate_id):
+        stage = finalist.stage - 1
+        rows.append({
+            "session_id": session.id,
+            "stage": stage,
+            "candidate_id": finalist.candidate_id,
+            "name": snapshot.candidates.get(finalist.candidate_id, {}).get("name"),
+            "points": snapshot.points(stage).get(finalist.candidate_id, 0),
+            "outcome": "qualified"
+        })
+    if snapshot.winner is not None:
+        rows.append({
+            "session_id": session.id,
+            "stage": session.stage,
+            "candidate_id": snapshot.winner["candidate_id"],
+            "name": snapshot.winner["name"],
+            "points": snapshot.winner["points"],
+            "outcome": "winner"
+        })
+    yield rows
+
+
+DATASETS = {
+    "votes": (["vote_id", "session_id", "stage", "user_id", "username", "candidate_id", "points"], _votes),
+    "tallies": (["session_id", "stage", "candidate_id", "name", "points"], _tallies),
+    "winners": (["session_id", "stage", "candidate_id", "name", "points", "outcome"], _winners),
+}
+
+
+def _ndjson_line(row: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(row) + b"\n"
+    return json.dumps(row, separators=(",", ":")).encode() + b"\n"
+
+
+def stream(session_id: int, dataset: str, fmt: str) -> Iterator[bytes]:
+    """
+    Encoded chunks of one dataset of a session, one per batch of rows.
+    """
+    columns, rows = DATASETS[dataset]
+    with SessionLocal() as db:
+        session = db.get(VotingSession, session_id)
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, columns)
+            writer.writeheader()
+            for batch in rows(db, session):
+                writer.writerows(batch)
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                # Only the header, when there are no rows
+                yield buffer.getvalue().encode()
+        else:
+            for batch in rows(db, session):
+                yield b"".join(_ndjson_line(row) for row in batch)
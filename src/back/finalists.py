@@ -0,0 +1,25 @@
+from sqlalchemy.orm import Session
+from back.models.models import Candidate, Finalist
+from back import engine, queries
+
+
+def record(db: Session, session_id: int, stage: int):
+    """
+    Store who qualified for `stage` from the points of the stage before it. Called
+    in the transaction that advances the session, after which those points no
+    longer change.
+    """
+    db.add_all([
+        Finalist(session_id=session_id, stage=stage, candidate_id=candidate_id)
+        for candidate_id in engine.qualify(queries.stage_points(db, session_id, stage - 1))
+    ])
+
+
+def candidates(db: Session, session_id: int, stage: int) -> list[Candidate]:
+    """
+    The recorded finalists of a stage, empty if the session never advanced to it.
+    """
+    return db.query(Candidate).join(Finalist, Finalist.candidate_id == Candidate.id).filter(
+        Finalist.session_id == session_id,
+        Finalist.stage == stage
+    ).order_by(Candidate.id).all()
@@ -0,0 +1,207 @@
+import asyncio
+import contextlib
+import logging
+import threading
+from dataclasses import dataclass, field
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from back.auth.cache import UserSnapshot
+from back.ballots import Ballot, check_candidates, check_session, check_votes, conflict, record
+from back.config import VOTE_BATCH_MAX, VOTE_BATCH_WINDOW_MS
+from back.database.database import AsyncDB, open_async_db
+from back.models.models import Candidate, Vote
+from back import invalidation, progress
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class UserVotes:
+    """What a user has voted (or has queued) in one stage of a session."""
+    candidate_ids: set[int] = field(default_factory=set)
+    points: set[int] = field(default_factory=set)
+
+
+class VoteIngester:
+    """
+    Group commit for votes (VOTE_GROUP_COMMIT). A request is checked against this
+    worker's record of what each user has voted, then queued. A background task
+    writes the queued ballots in one transaction with record()'s executemany, and
+    each request is answered once the transaction holding its votes has committed,
+    so a burst costs one commit per batch rather than one per vote.
+
+    The record is per worker and loaded from the votes on first use. The unique
+    indexes on votes still have the final say: when a batch hits one (e.g. the
+    same user voting through another worker), it is retried ballot by ballot so
+    only the conflicting requests fail.
+    """
+
+    def __init__(self):
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._users: dict[tuple[int, int, int], UserVotes] = {}
+        self._candidate_ids: frozenset[int] | None = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Commit what is queued, then stop."""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._queue, self._task = None, None
+
+    def invalidate(self, key=None):
+        # Sessions started, ended, deleted or advanced: reload what users voted from the database
+        with self._lock:
+            self._users.clear()
+
+    def invalidate_candidates(self, session_id: int | None = None):
+        if session_id is None:
+            with self._lock:
+                self._candidate_ids = None
+
+    async def submit(self, db: AsyncDB, session_id: int | None, candidate_ids: list[int], stage: int, current_user: UserSnapshot):
+        """
+        Check and queue a request's votes, and return (session_id, points, advanced)
+        once they are committed.
+        """
+        ballot = await db.run(self._reserve, session_id, candidate_ids, stage, current_user)
+        future = asyncio.get_running_loop().create_future()
+        try:
+            # Do not hold a pooled connection while waiting for the batch
+            await db.close()
+            await self._queue.put((ballot, future))
+        except BaseException:
+            # Cancelled (the client went away) before the batch took the ballot over
+            self._release(ballot)
+            raise
+        # Shielded: a client that disconnects must not cancel the future the batch resolves
+        advanced = await asyncio.shield(future)
+        return ballot.session_id, ballot.points, advanced
+
+    def _known_candidates(self, db: Session) -> frozenset[int]:
+        with self._lock:
+            known = self._candidate_ids
+        if known is None:
+            known = frozenset(candidate_id for (candidate_id,) in db.query(Candidate.id))
+            with self._lock:
+                self._candidate_ids = known
+        return known
+
+    def _reserve(self, db: Session, session_id: int | None, candidate_ids: list[int], stage: int, current_user: UserSnapshot) -> Ballot:
+        current_session = check_session(db, session_id, stage, current_user)
+        check_candidates(db, current_session.id, candidate_ids, self._known_candidates(db))
+
+        key = (current_session.id, stage, current_user.id)
+        with self._lock:
+            votes = self._users.get(key)
+        if votes is None:
+            rows = db.query(Vote.candidate_id, Vote.points).filter_by(
+                session_id=current_session.id,
+                stage=stage,
+                user_id=current_user.id
+            ).all()
+            loaded = UserVotes({candidate_id for candidate_id, _ in rows}, {points for _, points in rows})
+            with self._lock:
+                votes = self._users.setdefault(key, loaded)
+
+        with self._lock:
+            votes_remaining = progress.votes_per_user(stage) - len(votes.candidate_ids)
+            check_votes(candidate_ids, votes_remaining)
+            if votes.candidate_ids.intersection(candidate_ids):
+                raise HTTPException(status_code=400, detail="You have already voted for this candidate in this stage")
+            # The best points still unused (3, 2, 1 in stage 1), taken at once so a
+            # concurrent request of the same user gets the next ones
+            if stage == 1:
+                points = [p for p in (3, 2, 1) if p not in votes.points][:len(candidate_ids)]
+            else:
+                points = [1] * len(candidate_ids)
+            votes.candidate_ids.update(candidate_ids)
+            votes.points.update(points)
+        return Ballot(
+            session_id=current_session.id,
+            stage=stage,
+            user_id=current_user.id,
+            candidate_ids=candidate_ids,
+            points=points,
+            completes=len(candidate_ids) == votes_remaining
+        )
+
+    def _release(self, ballot: Ballot):
+        # The ballot was not recorded: forget the user's record, it is reloaded from the votes
+        with self._lock:
+            self._users.pop((ballot.session_id, ballot.stage, ballot.user_id), None)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + VOTE_BATCH_WINDOW_MS / 1000
+            while len(batch) < VOTE_BATCH_MAX:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            ballots = [ballot for ballot, _ in batch]
+            try:
+                db = open_async_db()
+                try:
+                    outcomes = await db.write(_commit, ballots)
+                finally:
+                    await db.close()
+            except Exception as e:
+                logger.exception("Writing a batch of %d ballots failed", len(ballots))
+                outcomes = [e] * len(ballots)
+
+            for (ballot, future), outcome in zip(batch, outcomes):
+                if isinstance(outcome, Exception):
+                    self._release(ballot)
+                    if not future.done():
+                        future.set_exception(outcome)
+                elif not future.done():
+                    future.set_result(outcome)
+                self._queue.task_done()
+
+
+def _commit(db: Session, ballots: list[Ballot]) -> list:
+    """
+    Write a batch in one transaction. If a unique index rejects it, write it again
+    one ballot per savepoint, so only the conflicting ballots fail. Returns, per
+    ballot, whether it advanced its session or the HTTPException to answer with.
+    """
+    try:
+        advanced = record(db, ballots)
+        db.commit()
+        return advanced
+    except IntegrityError:
+        db.rollback()
+
+    outcomes = []
+    for ballot in ballots:
+        try:
+            with db.begin_nested():
+                outcomes += record(db, [ballot])
+        except IntegrityError:
+            outcomes.append(conflict(db, ballot))
+    db.commit()
+    return outcomes
+
+
+vote_ingester = VoteIngester()
+invalidation.register("session", vote_ingester.invalidate)
+invalidation.register("snapshot", vote_ingester.invalidate_candidates)
@@ -0,0 +1,114 @@
+import json
+import logging
+import os
+import select
+import threading
+from collections import defaultdict
+from typing import Callable
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+from back.database.database import engine
+
+# In-process caches (active session, stage snapshots, decoded tokens) register a
+# handler per topic here. Writers call publish() after committing: the handlers of
+# this process run immediately and, on Postgres, a NOTIFY tells every other uvicorn
+# worker to run theirs. SQLite deployments are single-worker (`fcrvote serve`
+# starts one worker on SQLite), so there is nothing to notify.
+
+CHANNEL = "fcrvote_invalidate"
+
+logger = logging.getLogger(__name__)
+
+_handlers: dict[str, list[Callable]] = defaultdict(list)
+_listener: threading.Thread | None = None
+_stop = threading.Event()
+
+
+def register(topic: str, handler: Callable):
+    """
+    Call handler(key) whenever topic is invalidated. key is None when everything
+    under the topic must be dropped.
+    """
+    _handlers[topic].append(handler)
+
+
+def _dispatch(topic: str, key=None):
+    for handler in _handlers.get(topic, []):
+        handler(key)
+
+
+def _dispatch_all():
+    for topic in list(_handlers):
+        _dispatch(topic)
+
+
+def publish(topic: str, key=None):
+    _dispatch(topic, key)
+    if engine.dialect.name == "postgresql":
+        _notify(topic, key)
+
+
+async def publish_async(topic: str, key=None):
+    """
+    publish() for async routes: the NOTIFY to the other workers runs in the threadpool.
+    """
+    _dispatch(topic, key)
+    if engine.dialect.name == "postgresql":
+        await run_in_threadpool(_notify, topic, key)
+
+
+def _notify(topic: str, key=None):
+    payload = json.dumps({"pid": os.getpid(), "topic": topic, "key": key})
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": payload})
+            conn.commit()
+    except Exception:
+        logger.exception("Could not notify other workers of %s invalidation", topic)
+
+
+def _listen():
+    while not _stop.is_set():
+        conn = None
+        try:
+            # A dedicated connection, taken out of the pool for good
+            raw = engine.raw_connection()
+            conn = raw.driver_connection
+            raw.detach()
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+            # Notifications may have been missed while (re)connecting
+            _dispatch_all()
+            while not _stop.is_set():
+                if select.select([conn], [], [], 5) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    message = json.loads(conn.notifies.pop(0).payload)
+                    if message["pid"] != os.getpid():
+                        _dispatch(message["topic"], message["key"])
+        except Exception:
+            logger.exception("Invalidation listener failed, reconnecting")
+            _stop.wait(1)
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+def start_listener():
+    """
+    Start listening for other workers' invalidations (Postgres only).
+    """
+    global _listener
+    if engine.dialect.name != "postgresql" or _listener is not None:
+        return
+    _stop.clear()
+    _listener = threading.Thread(target=_listen, name="invalidation-listener", daemon=True)
+    _listener.start()
+
+
+def stop_listener():
+    global _listener
+    _stop.set()
+    _listener = None
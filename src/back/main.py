@@ -1,17 +1,55 @@
-from fastapi import FastAPI, Request
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
 import os
+import click
 import uvicorn
-from back.database.database import engine, Base, get_db
-from back.routers import auth, voting, admin, users, voting_sessions
-from back.models.models import User
+from back.database.database import engine, async_engine, get_db
+from back.routers import auth, voting, admin, users, voting_sessions, media, health, analytics
+from back import invalidation, metrics, tally
+from back.analytics import summarize_ended_sessions
+from back.archive import archive_ended_sessions, compact
+from back.auth.hashing import shutdown_pool
+from back.bootstrap import bootstrap, logger, readiness, warm_up
+from back.config import BOOTSTRAP_ON_STARTUP, ENV, FRONTEND_BUILD_DIR, GZIP_MINIMUM_SIZE, VOTE_GROUP_COMMIT, WEB_WORKERS
+from back.ingest import vote_ingester
+from back.static import FrontendFiles, compress_assets
+from back.engine import STAGE1_POINTS
+from back.responses import CompressionMiddleware, DefaultResponse
+from back.media import migrate_photos
+from back.provisioning import parse_users_csv, provision_users
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Attribute SQL statements to the request that runs them
+metrics.instrument(engine)
+if async_engine is not None:
+    metrics.instrument(async_engine.sync_engine)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    if BOOTSTRAP_ON_STARTUP:
+        await asyncio.to_thread(bootstrap)
+    # Hear about active session, snapshot and user changes made by other workers
+    invalidation.start_listener()
+    await warm_up()
+    if VOTE_GROUP_COMMIT:
+        vote_ingester.start()
+    readiness.startup_seconds = round(time.perf_counter() - started, 3)
+    readiness.ready = True
+    logger.info("Ready in %.3fs", readiness.startup_seconds)
+    yield
+    readiness.ready = False
+    if VOTE_GROUP_COMMIT:
+        await vote_ingester.stop()
+    invalidation.stop_listener()
+    shutdown_pool()
+    if async_engine is not None:
+        # asyncpg connections belong to this event loop
+        await async_engine.dispose()
+
+app = FastAPI(lifespan=lifespan, default_response_class=DefaultResponse)
 
 # Configure CORS
 app.add_middleware(
@@ -20,46 +58,139 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Link"],  # next page of the admin lists
 )
+app.add_middleware(CompressionMiddleware, minimum_size=GZIP_MINIMUM_SIZE)
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Include routers
+app.include_router(health.router)
 app.include_router(auth.router)
 app.include_router(voting.router, prefix="/voting")
+# The same routes for one session by id, for committees voting at the same time
+app.include_router(voting.router, prefix="/sessions/{session_id}")
 app.include_router(admin.router, prefix="/admin")
 app.include_router(users.router, prefix="/users")
 app.include_router(voting_sessions.router, prefix="/voting_sessions")
+app.include_router(media.router, prefix="/media")
+app.include_router(analytics.router, prefix="/analytics")
 
 if os.getenv("ENV") == "production":
     print("Loading production configuration...")
-    # Navigate to the frontend build directory
-    frontend_build_dir = "/home/front"
-
-    # Mount the static files directory
-    app.mount("/static", StaticFiles(directory=os.path.join(frontend_build_dir, "static")), name="static")
-    app.mount("/assets", StaticFiles(directory=frontend_build_dir), name="assets")
-
-    # Route to serve the index.html for any path not matched by the API routes
-    @app.get("/{full_path:path}", include_in_schema=False)
-    async def serve_frontend(request: Request, full_path: str):
-        # Exclude API paths
-        if full_path.startswith(("api/", "docs", "redoc", "openapi.json")):
-            return None  # Let FastAPI handle API routes
+    # Mounted last, so it only gets the paths no API route matched: build files
+    # (e.g. /static/js/main.<hash>.js) and, for client-side routes, index.html
+    frontend = FrontendFiles(FRONTEND_BUILD_DIR)
+    app.mount("/assets", frontend, name="assets")
+    app.mount("/", frontend, name="frontend")
 
-        # Serve the index.html for all other routes (to support client-side routing)
-        return FileResponse(os.path.join(frontend_build_dir, "index.html"))
+@click.group(invoke_without_command=True)
+@click.pass_context
+def main(ctx):
+    """Start the uvicorn server, or run one of the maintenance commands."""
+    if ctx.invoked_subcommand is None:
+        ctx.invoke(serve)
 
-if not next(get_db()).query(User).filter_by(is_admin=True).first():
-    user_model = User()
-    user_model.add_admin("admin", "1234")
-
-def main():
-    """Start the uvicorn server."""
+@main.command()
+@click.option("--workers", type=int, default=WEB_WORKERS, show_default=True, help="Number of uvicorn worker processes.")
+@click.option("--host", default="0.0.0.0", show_default=True)
+@click.option("--port", type=int, default=1095, show_default=True)
+@click.option("--reload/--no-reload", default=ENV != "production", help="Restart on code changes (single worker only; default outside production).")
+def serve(workers, host, port, reload):
+    """Set up the database once, then start the uvicorn workers."""
+    if workers > 1 and engine.dialect.name != "postgresql":
+        # The caches are per process and only Postgres tells the other workers to drop theirs
+        click.echo("Several workers need Postgres (their caches are kept in sync with NOTIFY); starting 1 worker.", err=True)
+        workers = 1
+    bootstrap()
+    # The workers inherit this, and find the database already set up
+    os.environ["BOOTSTRAP_ON_STARTUP"] = "false"
+    # And this, to split the cores between their password hashing pools
+    os.environ["WEB_WORKERS"] = str(workers)
     uvicorn.run(
         "back.main:app",
-        host="0.0.0.0",
-        port=1095,
-        reload=True if os.getenv("ENV") != "production" else False
+        host=host,
+        port=port,
+        workers=workers,
+        reload=reload and workers == 1,
+        # uvloop and httptools when installed (the "server" extra)
+        loop="auto",
+        http="auto"
     )
 
+@main.command()
+def migrate():
+    """Create missing tables and indexes, and the default admin user."""
+    bootstrap()
+    click.echo("Database ready.")
+
+@main.command("rebuild-tally")
+@click.option("--session-id", type=int, default=None, help="Only rebuild this session (default: all sessions).")
+def rebuild_tally(session_id):
+    """Recompute the per-stage tallies from the raw votes."""
+    tally.rebuild(next(get_db()), session_id=session_id)
+    click.echo("Tally rebuilt.")
+
+@main.command("rebuild-analytics")
+def rebuild_analytics():
+    """Summarize every ended session again for the /analytics routes."""
+    summarized = summarize_ended_sessions(next(get_db()))
+    click.echo(f"Summarized {summarized} sessions.")
+
+@main.command("archive")
+@click.option("--vacuum", is_flag=True, help="Compact the database afterwards (VACUUM).")
+def archive_command(vacuum):
+    """Move the votes of ended sessions out of the votes table."""
+    try:
+        archived = archive_ended_sessions(next(get_db()))
+    except HTTPException as e:
+        raise click.ClickException(e.detail)
+    click.echo(f"Archived {archived['votes']} votes of {archived['sessions']} sessions.")
+    if vacuum:
+        compact(engine)
+        click.echo("Database compacted.")
+
+@main.command("add-users")
+@click.argument("csv_file", type=click.File("r", encoding="utf-8-sig"))
+def add_users(csv_file):
+    """Add every user in CSV_FILE (username,password[,is_president])."""
+    try:
+        added = provision_users(next(get_db()), parse_users_csv(csv_file.read()))
+    except HTTPException as e:
+        raise click.ClickException(e.detail)
+    click.echo(f"{added} users added.")
+
+@main.command("compress-assets")
+@click.argument("directory", type=click.Path(exists=True, file_okay=False), default=FRONTEND_BUILD_DIR)
+def compress_assets_command(directory):
+    """Pre-build .gz (and .br) variants of the frontend build in DIRECTORY."""
+    written = compress_assets(directory, GZIP_MINIMUM_SIZE)
+    click.echo(f"Wrote {written} compressed files.")
+
+@main.command()
+@click.option("--elections", type=int, default=100_000, show_default=True)
+@click.option("--voters", type=int, default=30, show_default=True)
+@click.option("--candidates", type=int, default=8, show_default=True)
+@click.option("--points", default=",".join(map(str, STAGE1_POINTS)), show_default=True, help="Stage 1 points, best first; their number is how many candidates each voter ranks.")
+@click.option("--spread", type=float, default=1.0, show_default=True, help="Spread of the candidates' strengths (0: all equal).")
+@click.option("--seed", type=int, default=None)
+def simulate(elections, voters, candidates, points, spread, seed):
+    """Run Monte Carlo elections and report how often ties happen."""
+    # Imported here, so the server does not load NumPy
+    from back.simulation import simulate as run_simulation
+    try:
+        points = tuple(int(p) for p in points.split(","))
+        result = run_simulation(elections, voters, candidates, points, spread, seed)
+    except (RuntimeError, ValueError) as e:
+        raise click.ClickException(str(e))
+    for name, value in result.items():
+        click.echo(f"{name}: {value}")
+    click.echo(f"ballots/s: {result['ballots'] / max(result['seconds'], 1e-9):,.0f}")
+
+@main.command("migrate-photos")
+def migrate_photos_command():
+    """Move inline base64 photos into the media store."""
+    migrated = migrate_photos(next(get_db()))
+    click.echo(f"Migrated {migrated} photos.")
+
 if __name__ == "__main__":
     main()
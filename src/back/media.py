@@ -0,0 +1,113 @@
+import base64
+import binascii
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from back.config import MEDIA_CACHE_SIZE, THUMBNAIL_SIZE
+from back.models.models import Candidate, Media, User
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional, without it no thumbnails are generated
+    Image = None
+
+MEDIA_PREFIX = "/media/"
+
+
+def media_url(digest: str) -> str:
+    return f"{MEDIA_PREFIX}{digest}"
+
+
+def decode_data_url(photo: str) -> tuple[str, bytes]:
+    """
+    Split a data:image/...;base64,... URL into its content type and raw bytes.
+    """
+    header, _, payload = photo.partition(",")
+    if not header.startswith("data:") or not header.endswith(";base64"):
+        raise HTTPException(status_code=400, detail="Photo must be a base64 data URL")
+    content_type = header[len("data:"):-len(";base64")] or "application/octet-stream"
+    try:
+        return content_type, base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Photo is not valid base64")
+
+
+def make_thumbnail(data: bytes) -> bytes | None:
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            output = io.BytesIO()
+            image.convert("RGB").save(output, format="JPEG", quality=85)
+            return output.getvalue()
+    except OSError:
+        # Not an image Pillow understands, the original is served instead
+        return None
+
+
+def store_photo(db: Session, photo: str | None) -> str | None:
+    """
+    Store an inline data URL photo in the content-addressed media table and return
+    its /media URL. Empty values, and photos that already are URLs, pass through.
+    Does not commit; the caller commits together with the row that references it.
+    """
+    if not photo or not photo.startswith("data:"):
+        return photo or None
+    content_type, data = decode_data_url(photo)
+    digest = hashlib.sha256(data).hexdigest()
+    if not db.query(Media.digest).filter_by(digest=digest).first():
+        try:
+            with db.begin_nested():
+                db.add(Media(digest=digest, content_type=content_type, data=data, thumbnail=make_thumbnail(data)))
+        except IntegrityError:
+            pass  # Stored concurrently by another request
+    return media_url(digest)
+
+
+class MediaCache:
+    """
+    Small LRU of decoded blobs so repeat requests that miss the browser and proxy
+    caches don't go back to the database. Blobs never change, so nothing is invalidated.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, tuple[str, bytes, bytes | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, digest: str) -> tuple[str, bytes, bytes | None] | None:
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                return entry
+        media = db.query(Media).filter_by(digest=digest).first()
+        if media is None:
+            return None
+        entry = (media.content_type, media.data, media.thumbnail)
+        with self._lock:
+            self._entries[digest] = entry
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+
+media_cache = MediaCache(MEDIA_CACHE_SIZE)
+
+
+def migrate_photos(db: Session) -> int:
+    """
+    Move inline data URL photos of existing candidates and users into the media table.
+    """
+    migrated = 0
+    for model in (Candidate, User):
+        for row in db.query(model).filter(model.photo.like("data:%")).all():
+            row.photo = store_photo(db, row.photo)
+            migrated += 1
+    db.commit()
+    return migrated
@@ -0,0 +1,230 @@
+import contextvars
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from sqlalchemy import event
+from back.config import SERVER_TIMING
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the request and database time histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+@dataclass
+class RequestStats:
+    """Database work done while serving one request."""
+    queries: int = 0
+    db_time: float = 0.0
+    slowest_time: float = 0.0
+    slowest_statement: str = ""
+
+
+# Stats of the request being served. The threadpool and the async engine's greenlets
+# run with a copy of the request's context, so they record into the same object.
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = _current.get()
+    if stats is None:
+        return
+    stats.queries += 1
+    stats.db_time += elapsed
+    if elapsed > stats.slowest_time:
+        stats.slowest_time = elapsed
+        stats.slowest_statement = statement
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute
+    starts = context.connection.info.get("query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def instrument(engine):
+    """
+    Time every statement run on `engine` and attribute it to the current request.
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                break
+        else:
+            i = len(BUCKETS)
+        self.counts[i] += 1
+        self.sum += value
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.responses: dict[int, int] = {}
+        self.duration = Histogram()
+        self.db_duration = Histogram()
+        self.queries = 0
+        self.slowest_query = 0.0
+
+
+class MetricsRegistry:
+    """
+    Per-route request and database metrics of this worker, keyed by method and
+    route template so that path parameters do not multiply the series.
+    """
+
+    def __init__(self):
+        self._routes: dict[tuple[str, str], RouteMetrics] = {}
+        self._lock = threading.Lock()
+
+    def record(self, method: str, route: str, status: int, duration: float, stats: RequestStats):
+        with self._lock:
+            metrics = self._routes.get((method, route))
+            if metrics is None:
+                metrics = self._routes[(method, route)] = RouteMetrics()
+            metrics.responses[status] = metrics.responses.get(status, 0) + 1
+            metrics.duration.observe(duration)
+            metrics.db_duration.observe(stats.db_time)
+            metrics.queries += stats.queries
+            slower = stats.slowest_time > metrics.slowest_query
+            if slower:
+                metrics.slowest_query = stats.slowest_time
+        if slower:
+            # Logged rather than exported, so the statement text stays on the server
+            logger.info("Slowest statement so far for %s %s (%.2f ms): %s", method, route,
+                        1000 * stats.slowest_time, " ".join(stats.slowest_statement.split()))
+
+    def render(self, families: dict[str, tuple[str, list[tuple[dict, float]]]] = None) -> str:
+        """
+        The metrics in the Prometheus text exposition format. `families` adds other
+        metrics, as {name: (type, [(labels, value), ...])}.
+        """
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = []
+
+            lines += ["# HELP fcrvote_http_requests_total Responses sent, by route and status.",
+                      "# TYPE fcrvote_http_requests_total counter"]
+            for (method, route), metrics in routes:
+                for status, count in sorted(metrics.responses.items()):
+                    lines.append(_sample("fcrvote_http_requests_total", {"method": method, "route": route, "status": status}, count))
+
+            for name, help_text, attr in (
+                ("fcrvote_http_request_duration_seconds", "Time to the first byte of the response.", "duration"),
+                ("fcrvote_db_request_duration_seconds", "Time spent executing SQL per request.", "db_duration"),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for (method, route), metrics in routes:
+                    lines += _histogram(name, {"method": method, "route": route}, getattr(metrics, attr))
+
+            lines += ["# HELP fcrvote_db_queries_total SQL statements executed, by route.",
+                      "# TYPE fcrvote_db_queries_total counter"]
+            for (method, route), metrics in routes:
+                lines.append(_sample("fcrvote_db_queries_total", {"method": method, "route": route}, metrics.queries))
+
+            lines += ["# HELP fcrvote_db_slowest_query_seconds Slowest SQL statement seen, by route.",
+                      "# TYPE fcrvote_db_slowest_query_seconds gauge"]
+            for (method, route), metrics in routes:
+                lines.append(_sample("fcrvote_db_slowest_query_seconds", {"method": method, "route": route}, metrics.slowest_query))
+
+        for name, (kind, samples) in (families or {}).items():
+            lines.append(f"# TYPE {name} {kind}")
+            lines += [_sample(name, labels, value) for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _sample(name: str, labels: dict, value) -> str:
+    if not labels:
+        return f"{name} {value}"
+    label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+    return f"{name}{{{label_text}}} {value}"
+
+
+def _histogram(name: str, labels: dict, histogram: Histogram) -> list[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip((*BUCKETS, "+Inf"), histogram.counts):
+        cumulative += count
+        lines.append(_sample(f"{name}_bucket", {**labels, "le": bound}, cumulative))
+    lines.append(_sample(f"{name}_sum", labels, round(histogram.sum, 6)))
+    lines.append(_sample(f"{name}_count", labels, cumulative))
+    return lines
+
+
+registry = MetricsRegistry()
+
+
+def _server_timing(stats: RequestStats, duration: float) -> str:
+    metrics = [
+        f'db;dur={1000 * stats.db_time:.2f};desc="{stats.queries} queries"',
+        f"app;dur={1000 * duration:.2f}",
+    ]
+    if stats.queries:
+        # The duration only: the statement text would show the schema to any client,
+        # so it is only logged
+        metrics.insert(1, f"db-slowest;dur={1000 * stats.slowest_time:.2f}")
+    return ", ".join(metrics)
+
+
+class MetricsMiddleware:
+    """
+    Records the SQL statements, database time and slowest statement of every
+    request, adds their timings to the response as a Server-Timing header and
+    aggregates them per route for /admin/metrics.
+
+    Timings are taken when the response starts, so a streaming response only
+    counts the work done before its first byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        _current.set(stats)
+        start = time.perf_counter()
+        recorded = False
+
+        def record(status: int) -> float:
+            nonlocal recorded
+            recorded = True
+            duration = time.perf_counter() - start
+            # Unmatched paths share one series, so scanners cannot grow the registry
+            route = getattr(scope.get("route"), "path", "unmatched")
+            registry.record(scope["method"], route, status, duration, stats)
+            return duration
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                duration = record(message["status"])
+                if SERVER_TIMING:
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", _server_timing(stats, duration).encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            if not recorded:
+                record(500)
@@ -1,11 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, UniqueConstraint, Index, LargeBinary, DateTime
 from back.database.database import Base, get_db
-from passlib.context import CryptContext
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
+from back.auth.hashing import get_password_hash
 
 class User(Base):
     __tablename__ = "users"
@@ -41,9 +36,94 @@ class VotingSession(Base):
 
 class Vote(Base):
     __tablename__ = "votes"
+    __table_args__ = (
+        Index("ix_votes_session_stage_candidate", "session_id", "stage", "candidate_id"),
+        # One vote per candidate, and one vote per points value (3/2/1 in stage 1, 1 after),
+        # for each user and stage. These also serve the (session_id, stage, user_id) lookups.
+        Index("uq_votes_session_stage_user_candidate", "session_id", "stage", "user_id", "candidate_id", unique=True),
+        Index("uq_votes_session_stage_user_points", "session_id", "stage", "user_id", "points", unique=True),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     candidate_id = Column(Integer, ForeignKey("candidates.id"))
     session_id = Column(Integer, ForeignKey("voting_sessions.id"))
     stage = Column(Integer)  # 1 to 3
-    points = Column(Integer, default=0)  # Points awarded for this vote (3, 2, or 1)
\ No newline at end of file
+    points = Column(Integer, default=0)  # Points awarded for this vote (3, 2, or 1)
+
+class ArchivedVote(Base):
+    """Votes of ended sessions, moved out of `votes` by the archive command. Same columns and ids."""
+    __tablename__ = "archived_votes"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    candidate_id = Column(Integer, ForeignKey("candidates.id"))
+    session_id = Column(Integer, ForeignKey("voting_sessions.id"), index=True)
+    stage = Column(Integer)
+    points = Column(Integer, default=0)
+
+class StageProgress(Base):
+    """Number of users who have cast all their votes in a stage of a session."""
+    __tablename__ = "stage_progress"
+    session_id = Column(Integer, ForeignKey("voting_sessions.id"), primary_key=True)
+    stage = Column(Integer, primary_key=True)
+    completed = Column(Integer, default=0)
+
+class Tally(Base):
+    """Running sum of points per session, stage and candidate, maintained alongside Vote."""
+    __tablename__ = "tallies"
+    __table_args__ = (UniqueConstraint("session_id", "stage", "candidate_id"),)
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, ForeignKey("voting_sessions.id"))
+    stage = Column(Integer)
+    candidate_id = Column(Integer, ForeignKey("candidates.id"))
+    points = Column(Integer, default=0)
+
+class SessionCandidate(Base):
+    """Candidates on the ballot of a session. A session without rows here lists every candidate."""
+    __tablename__ = "session_candidates"
+    session_id = Column(Integer, ForeignKey("voting_sessions.id"), primary_key=True)
+    candidate_id = Column(Integer, ForeignKey("candidates.id"), primary_key=True)
+
+class SessionVoter(Base):
+    """Users who vote in a session. A session without rows here is voted by every non-admin user."""
+    __tablename__ = "session_voters"
+    session_id = Column(Integer, ForeignKey("voting_sessions.id"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+
+class Finalist(Base):
+    """Candidates who qualified for a stage, recorded when the session advanced to it."""
+    __tablename__ = "finalists"
+    session_id = Column(Integer, ForeignKey("voting_sessions.id"), primary_key=True)
+    stage = Column(Integer, primary_key=True)
+    candidate_id = Column(Integer, ForeignKey("candidates.id"), primary_key=True)
+
+class SessionResult(Base):
+    """How a candidate did in an ended session, written by end_session for /analytics."""
+    __tablename__ = "session_results"
+    __table_args__ = (Index("ix_session_results_candidate_session", "candidate_id", "session_id"),)
+    session_id = Column(Integer, ForeignKey("voting_sessions.id"), primary_key=True)
+    candidate_id = Column(Integer, ForeignKey("candidates.id"), primary_key=True)
+    stage1_points = Column(Integer, default=0)
+    stage2_points = Column(Integer, default=0)
+    total_points = Column(Integer, default=0)
+    rank = Column(Integer)  # 1 for the winner, then by stage 2 and stage 1 points; ties share a rank
+    finalist = Column(Boolean, default=False)  # qualified for stage 2
+    winner = Column(Boolean, default=False)
+
+class SessionStats(Base):
+    """Participation in an ended session, written by end_session for /analytics."""
+    __tablename__ = "session_stats"
+    session_id = Column(Integer, ForeignKey("voting_sessions.id"), primary_key=True)
+    eligible_voters = Column(Integer, default=0)
+    stage1_voters = Column(Integer, default=0)  # users who cast all their stage 1 votes
+    stage2_voters = Column(Integer, default=0)
+    candidates = Column(Integer, default=0)
+    winner_id = Column(Integer, ForeignKey("candidates.id"), nullable=True)
+    ended_at = Column(DateTime, index=True)  # UTC; the /analytics routes list sessions newest first by it
+
+class Media(Base):
+    """Content-addressed photo storage, keyed by the SHA-256 of the original bytes."""
+    __tablename__ = "media"
+    digest = Column(String, primary_key=True)
+    content_type = Column(String)
+    data = Column(LargeBinary)
+    thumbnail = Column(LargeBinary, nullable=True)  # JPEG, only when Pillow is installed
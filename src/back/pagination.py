@@ -0,0 +1,54 @@
+from functools import lru_cache
+from fastapi import HTTPException, Request, Response
+from pydantic import BaseModel, ConfigDict, TypeAdapter, create_model
+from sqlalchemy.orm import Session, load_only
+from back.responses import model_response
+
+
+def parse_fields(model: type[BaseModel], fields: str | None) -> tuple[str, ...]:
+    """
+    The response model fields named in a `fields=a,b` query parameter, in model
+    order, or all of them. The id is the page cursor, so it is always included.
+    """
+    if fields is None:
+        return tuple(model.model_fields)
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = sorted(names - model.model_fields.keys())
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown field: {unknown[0]}")
+    return tuple(name for name in model.model_fields if name == "id" or name in names)
+
+
+@lru_cache(maxsize=64)
+def projection(model: type[BaseModel], fields: tuple[str, ...]) -> TypeAdapter:
+    """A list adapter for `model` restricted to `fields`."""
+    if fields != tuple(model.model_fields):
+        model = create_model(
+            model.__name__,
+            __config__=ConfigDict(from_attributes=True),
+            **{name: (info.annotation, info) for name, info in model.model_fields.items() if name in fields}
+        )
+    return TypeAdapter(list[model])
+
+
+def page(db: Session, entity, fields: tuple[str, ...], after: int | None, limit: int) -> list:
+    """
+    Up to `limit` rows of `entity` with an id above `after`, in id order, loading
+    only the columns of `fields`.
+    """
+    query = db.query(entity).options(load_only(*(getattr(entity, name) for name in fields)))
+    if after is not None:
+        query = query.filter(entity.id > after)
+    return query.order_by(entity.id).limit(limit).all()
+
+
+def page_response(request: Request, response: Response, model: type[BaseModel], fields: tuple[str, ...], rows: list, limit: int) -> Response:
+    """
+    Serialize a page and, when it is full, point to the next one with a
+    `Link: <...>; rel="next"` header.
+    """
+    if len(rows) == limit:
+        # Relative, so it keeps the scheme and host the client used in front of a proxy
+        next_url = request.url.include_query_params(after=rows[-1].id)
+        response.headers["Link"] = f'<{next_url.path}?{next_url.query}>; rel="next"'
+    return model_response(projection(model, fields), rows, response)
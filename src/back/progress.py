@@ -0,0 +1,72 @@
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from back.models.models import StageProgress, Vote, VotingSession
+from back import finalists
+
+
+def votes_per_user(stage: int) -> int:
+    """
+    Votes each user casts in a stage: three ranked votes in stage 1, one afterwards.
+    """
+    return 3 if stage == 1 else 1
+
+
+def count_completed(db: Session, session_id: int, stage: int) -> int:
+    """
+    Users who have cast all their votes in a stage, counted from the votes themselves.
+    """
+    users = db.query(Vote.user_id).filter_by(
+        session_id=session_id,
+        stage=stage
+    ).group_by(Vote.user_id).having(func.count(Vote.id) >= votes_per_user(stage)).subquery()
+    return db.query(func.count()).select_from(users).scalar()
+
+
+def complete_user(db: Session, session_id: int, stage: int, users: int = 1) -> int:
+    """
+    Record that one more user (or `users` more) finished a stage and return the new
+    number of users who have. The UPDATE takes a row lock, so concurrent calls are
+    serialized and each sees a distinct count.
+    """
+    increment = update(StageProgress).where(
+        StageProgress.session_id == session_id,
+        StageProgress.stage == stage
+    ).values(completed=StageProgress.completed + users).returning(StageProgress.completed)
+
+    completed = db.execute(increment).scalar()
+    if completed is not None:
+        return completed
+
+    # First user to finish this stage, or a session started before stage progress was
+    # tracked: seed the counter from the votes, which include the callers' flushed votes.
+    db.flush()
+    try:
+        with db.begin_nested():
+            completed = count_completed(db, session_id, stage)
+            db.add(StageProgress(session_id=session_id, stage=stage, completed=completed))
+        return completed
+    except IntegrityError:
+        # Seeded concurrently by another request
+        return db.execute(increment).scalar()
+
+
+def set_completed(db: Session, session_id: int, stage: int, completed: int):
+    db.query(StageProgress).filter_by(session_id=session_id, stage=stage).delete(synchronize_session=False)
+    db.add(StageProgress(session_id=session_id, stage=stage, completed=completed))
+
+
+def advance_stage(db: Session, session_id: int, stage: int) -> bool:
+    """
+    Move the session from `stage` to the next one, recording who qualified for it.
+    Only succeeds once, for the request that finds the session still on `stage`.
+    """
+    result = db.execute(update(VotingSession).where(
+        VotingSession.id == session_id,
+        VotingSession.stage == stage
+    ).values(stage=stage + 1))
+    if result.rowcount != 1:
+        return False
+    if stage + 1 <= 3:
+        finalists.record(db, session_id, stage + 1)
+    return True
@@ -0,0 +1,49 @@
+import csv
+import io
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from back.auth.hashing import hash_passwords
+from back.models.models import User
+from back.schemas.schemas import UserCreate
+
+TRUE_VALUES = {"1", "true", "yes", "y", "x"}
+
+
+def parse_users_csv(text: str) -> list[UserCreate]:
+    """
+    Parse a CSV with a header row of username,password[,is_president].
+    """
+    users = []
+    reader = csv.DictReader(io.StringIO(text))
+    for line, row in enumerate(reader, start=2):
+        try:
+            users.append(UserCreate(
+                username=row["username"].strip(),
+                password=row["password"],
+                is_president=(row.get("is_president") or "").strip().lower() in TRUE_VALUES
+            ))
+        except (KeyError, AttributeError, ValidationError):
+            raise HTTPException(status_code=400, detail=f"Invalid user on line {line}")
+    return users
+
+
+def provision_users(db: Session, users: list[UserCreate]) -> int:
+    """
+    Create many users at once: passwords are hashed in parallel on the hashing
+    process pool and every user is inserted in a single transaction.
+    """
+    usernames = [user.username for user in users]
+    if len(set(usernames)) != len(usernames):
+        raise HTTPException(status_code=400, detail="Duplicate usernames in the list")
+    existing = [username for username, in db.query(User.username).filter(User.username.in_(usernames)).all()]
+    if existing:
+        raise HTTPException(status_code=400, detail=f"Users already exist: {', '.join(sorted(existing))}")
+
+    hashes = hash_passwords([user.password for user in users])
+    db.add_all([
+        User(username=user.username, hashed_password=hashed, is_president=user.is_president, is_admin=False)
+        for user, hashed in zip(users, hashes)
+    ])
+    db.commit()
+    return len(users)
@@ -0,0 +1,89 @@
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from back.config import USE_TALLY_TABLE
+from back.models.models import Vote
+from back import tally
+
+# Aggregate reads shared by the results, winner, candidates and status endpoints.
+# They read the maintained tally table when it is enabled, and otherwise let the
+# database do the summing with GROUP BY over the (indexed) votes table.
+
+
+def vote_stage_points(db: Session, session_id: int, stage: int) -> dict[int, int]:
+    rows = db.query(Vote.candidate_id, func.sum(Vote.points)).filter_by(
+        session_id=session_id,
+        stage=stage
+    ).group_by(Vote.candidate_id).order_by(func.min(Vote.id)).all()
+    return {candidate_id: int(points) for candidate_id, points in rows}
+
+
+def vote_total_points(db: Session, session_id: int) -> dict[int, int]:
+    rows = db.query(Vote.candidate_id, func.sum(Vote.points)).filter_by(
+        session_id=session_id
+    ).group_by(Vote.candidate_id).all()
+    return {candidate_id: int(points) for candidate_id, points in rows}
+
+
+def vote_session_points(db: Session, session_id: int) -> dict[int, dict[int, int]]:
+    stages: dict[int, dict[int, int]] = {}
+    rows = db.query(Vote.stage, Vote.candidate_id, func.sum(Vote.points)).filter_by(
+        session_id=session_id
+    ).group_by(Vote.stage, Vote.candidate_id).order_by(func.min(Vote.id)).all()
+    for stage, candidate_id, points in rows:
+        stages.setdefault(stage, {})[candidate_id] = int(points)
+    return stages
+
+
+def vote_candidate_points(db: Session, session_id: int, candidate_id: int) -> int:
+    points = db.query(func.sum(Vote.points)).filter_by(
+        session_id=session_id,
+        candidate_id=candidate_id
+    ).scalar()
+    return int(points or 0)
+
+
+def stage_points(db: Session, session_id: int, stage: int) -> dict[int, int]:
+    """
+    Points per candidate for a single stage, in the order candidates first received votes.
+    """
+    if USE_TALLY_TABLE:
+        return tally.stage_points(db, session_id, stage)
+    return vote_stage_points(db, session_id, stage)
+
+
+def session_points(db: Session, session_id: int) -> dict[int, dict[int, int]]:
+    """
+    Points per candidate for every stage of a session, keyed by stage, in one query.
+    """
+    if USE_TALLY_TABLE:
+        return tally.session_points(db, session_id)
+    return vote_session_points(db, session_id)
+
+
+def total_points(db: Session, session_id: int) -> dict[int, int]:
+    """
+    Points per candidate summed across every stage of a session.
+    """
+    if USE_TALLY_TABLE:
+        return tally.total_points(db, session_id)
+    return vote_total_points(db, session_id)
+
+
+def candidate_points(db: Session, session_id: int, candidate_id: int) -> int:
+    """
+    Points a single candidate got across every stage of a session.
+    """
+    if USE_TALLY_TABLE:
+        return tally.candidate_points(db, session_id, candidate_id)
+    return vote_candidate_points(db, session_id, candidate_id)
+
+
+def user_vote_count(db: Session, session_id: int, stage: int, user_id: int) -> int:
+    """
+    Number of votes a user has cast in a stage.
+    """
+    return db.query(func.count(Vote.id)).filter_by(
+        session_id=session_id,
+        stage=stage,
+        user_id=user_id
+    ).scalar()
@@ -0,0 +1,44 @@
+from typing import Any
+from fastapi import Response
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+from starlette.middleware.gzip import GZipMiddleware
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, without it the stdlib json module is used
+    orjson = None
+
+# Response class for every route that returns plain dicts and lists
+DefaultResponse = ORJSONResponse if orjson is not None else JSONResponse
+
+
+def model_response(adapter: TypeAdapter, data: Any, response: Response | None = None) -> Response:
+    """
+    Validate `data` (ORM objects or dicts) against a response model and serialize it
+    straight to JSON bytes with pydantic, instead of FastAPI's validate, convert to
+    dicts, then json.dumps. Headers set on the injected `response` (e.g. the ETag)
+    are carried over.
+    """
+    body = adapter.dump_json(adapter.validate_python(data, from_attributes=True))
+    headers = dict(response.headers) if response is not None else None
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZip for responses over the size threshold, except photos, which are already
+    compressed images, and range requests, whose byte offsets refer to the
+    uncompressed file. Responses that already carry a Content-Encoding (the
+    pre-built frontend variants) pass through untouched.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and (scope["path"].startswith("/media/") or _has_header(scope, b"range")):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+def _has_header(scope, name: bytes) -> bool:
+    return any(key == name for key, _ in scope["headers"])
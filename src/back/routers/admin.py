@@ -1,9 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from back.database.database import get_db
-from back.models.models import User, Candidate
-from back.auth.auth import get_password_hash
-from back.schemas.schemas import CandidateCreate, UserCreate
+from back.database.database import engine, get_db, pool_stats
+from back.models.models import User, Candidate, VotingSession
+from back.auth.auth import get_current_user, token_cache
+from back.auth.hashing import get_password_hash
+from back.auth.cache import UserSnapshot
+from back.schemas.schemas import CandidateCreate, CandidateOut, UserCreate, UserOut
+from back.media import store_photo
+from back.provisioning import parse_users_csv, provision_users
+from back import invalidation
+from back.metrics import registry
+from back.versions import data_versions, not_modified
+from back.pagination import page, page_response, parse_fields
+from back.config import ADMIN_PAGE_SIZE, ADMIN_MAX_PAGE_SIZE
+from back.archive import archive_ended_sessions, compact
+from back import export
 
 router = APIRouter()
 
@@ -11,15 +25,24 @@ router = APIRouter()
 def add_candidate(candidate_data: CandidateCreate, db: Session = Depends(get_db)):
     if db.query(Candidate).filter_by(name=candidate_data.name).first():
         raise HTTPException(status_code=400, detail="Candidate already exists")
-    candidate = Candidate(name=candidate_data.name, photo=candidate_data.photo, description=candidate_data.description)
+    candidate = Candidate(name=candidate_data.name, photo=store_photo(db, candidate_data.photo), description=candidate_data.description)
     db.add(candidate)
     db.commit()
+    invalidation.publish("snapshot")
     return {"message": "Candidate added"}
 
 @router.get("/get_candidates")
-def get_candidates(db: Session = Depends(get_db)):
-    candidates = db.query(Candidate).all()
-    return candidates
+def get_candidates(request: Request, response: Response, after: int | None = None, limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=ADMIN_MAX_PAGE_SIZE), fields: str | None = None, db: Session = Depends(get_db)):
+    """
+    Candidates by id, a page at a time: pass `after` the last id of a page (or
+    follow the Link header) for the next one, and `fields` to pick the columns.
+    """
+    selected = parse_fields(CandidateOut, fields)
+    cached = not_modified(request, response, data_versions.etag("admin_candidates", after, limit, *selected))
+    if cached is not None:
+        return cached
+    candidates = page(db, Candidate, selected, after, limit)
+    return page_response(request, response, CandidateOut, selected, candidates, limit)
 
 @router.delete("/remove_candidate/{candidate_id}")
 def remove_candidate(candidate_id: int, db: Session = Depends(get_db)):
@@ -28,21 +51,36 @@ def remove_candidate(candidate_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Candidate not found")
     db.delete(candidate)
     db.commit()
+    invalidation.publish("snapshot")
     return {"message": "Candidate removed"}
 
 @router.post("/add_user")
 def add_user(user_data: UserCreate, db: Session = Depends(get_db)):
     if db.query(User).filter_by(username=user_data.username).first():
         raise HTTPException(status_code=400, detail="User already exists")
-    user = User(username=user_data.username, hashed_password=get_password_hash(user_data.password), is_president=user_data.is_president, is_admin=False)
+    user = User(username=user_data.username, hashed_password=get_password_hash(user_data.password), is_president=user_data.is_president, is_admin=False, photo=store_photo(db, user_data.photo))
     db.add(user)
     db.commit()
+    invalidation.publish("user", user.username)
     return {"message": "User added"}
 
+@router.post("/add_users")
+async def add_users(file: UploadFile, db: Session = Depends(get_db)):
+    """
+    Add every user in an uploaded CSV (username,password[,is_president]) in one transaction.
+    """
+    users = parse_users_csv((await file.read()).decode("utf-8-sig"))
+    added = await run_in_threadpool(provision_users, db, users)
+    return {"message": f"{added} users added"}
+
 @router.get("/get_users")
-def get_users(db: Session = Depends(get_db)):
-    users = db.query(User).all()
-    return users
+def get_users(request: Request, response: Response, after: int | None = None, limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=ADMIN_MAX_PAGE_SIZE), fields: str | None = None, db: Session = Depends(get_db)):
+    """
+    Users by id, paged like /get_candidates.
+    """
+    selected = parse_fields(UserOut, fields)
+    users = page(db, User, selected, after, limit)
+    return page_response(request, response, UserOut, selected, users, limit)
 
 @router.delete("/remove_user/{user_id}")
 def remove_user(user_id: int, db: Session = Depends(get_db)):
@@ -51,4 +89,62 @@ def remove_user(user_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="User not found")
     db.delete(user)
     db.commit()
-    return {"message": "User removed"}
\ No newline at end of file
+    invalidation.publish("user", user.username)
+    return {"message": "User removed"}
+
+@router.get("/auth_cache")
+def get_auth_cache_stats():
+    return token_cache.stats()
+
+@router.get("/db_pool")
+def get_db_pool_stats():
+    return pool_stats()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Per-route request and SQL metrics of this worker, with its connection pool and
+    token cache usage, in the Prometheus text format.
+    """
+    families = {}
+    for pool, stats in pool_stats().items():
+        for key, value in stats.items():
+            if isinstance(value, (int, float)):
+                kind = "counter" if key in ("checkouts", "timeouts") else "gauge"
+                families.setdefault(f"fcrvote_db_pool_{key}", (kind, []))[1].append(({"pool": pool}, value))
+    for key, value in token_cache.stats().items():
+        kind = "counter" if key in ("hits", "misses") else "gauge"
+        families[f"fcrvote_token_cache_{key}"] = (kind, [({}, value)])
+    return PlainTextResponse(registry.render(families), media_type="text/plain; version=0.0.4")
+
+def _require_admin(current_user: UserSnapshot):
+    if not (current_user.is_admin or current_user.is_president):
+        raise HTTPException(status_code=403, detail="Only an admin or the president can do this")
+
+@router.get("/export/{session_id}/{dataset}")
+def export_session(session_id: int, dataset: Literal["votes", "tallies", "winners"], format: Literal["ndjson", "csv"] = "ndjson", current_user: UserSnapshot = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Stream a session's votes (archived ones included), per-stage tallies or
+    qualifiers and winner, as NDJSON or CSV.
+    """
+    _require_admin(current_user)
+    if db.get(VotingSession, session_id) is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return StreamingResponse(
+        export.stream(session_id, dataset, format),
+        media_type=export.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="session-{session_id}-{dataset}.{format}"'}
+    )
+
+@router.post("/archive_sessions")
+def archive_sessions(vacuum: bool = False, current_user: UserSnapshot = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Move the votes of ended sessions out of the votes table, then optionally
+    compact the database.
+    """
+    _require_admin(current_user)
+    archived = archive_ended_sessions(db)
+    if vacuum:
+        db.close()
+        compact(engine)
+    return archived
@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from back.database.database import AsyncDB, get_async_db
+from back.models.models import Candidate
+from back import analytics
+
+router = APIRouter()
+
+@router.get("/candidates/{candidate_id}/history")
+async def candidate_history(candidate_id: int, limit: int = Query(20, ge=1, le=1000), db: AsyncDB = Depends(get_async_db)):
+    """
+    A candidate's points, rank and finalist or winner place in the last `limit`
+    ended sessions, newest first.
+    """
+    return await db.run(_candidate_history, candidate_id, limit)
+
+def _candidate_history(db: Session, candidate_id: int, limit: int):
+    if db.get(Candidate, candidate_id) is None:
+        raise HTTPException(status_code=404, detail="Candidate not found")
+    return analytics.candidate_history(db, candidate_id, limit)
+
+@router.get("/participation")
+async def participation(limit: int = Query(20, ge=1, le=1000), db: AsyncDB = Depends(get_async_db)):
+    """
+    Eligible voters and how many of them finished each stage, for the last `limit`
+    ended sessions, newest first.
+    """
+    return await db.run(analytics.participation, limit)
+
+@router.get("/leaderboard")
+async def leaderboard(sessions: int | None = Query(None, ge=1), limit: int = Query(10, ge=1, le=1000), db: AsyncDB = Depends(get_async_db)):
+    """
+    The best candidates by wins, finalist places and points, over the last
+    `sessions` ended sessions (default: all).
+    """
+    return await db.run(analytics.leaderboard, sessions, limit)
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, HTTPException
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from back.bootstrap import readiness
+from back.database.database import engine
+
+router = APIRouter()
+
+@router.get("/healthz")
+def healthz():
+    """
+    Liveness: the worker is up and serving requests.
+    """
+    return {"status": "ok"}
+
+@router.get("/readyz")
+def readyz():
+    """
+    Readiness: startup and warm-up are done, the worker is not shutting down,
+    and the database answers.
+    """
+    if not readiness.ready:
+        raise HTTPException(status_code=503, detail="Not ready")
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    except SQLAlchemyError:
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    return {"status": "ready", "startup_seconds": readiness.startup_seconds}
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.orm import Session
+from back.database.database import get_db
+from back.media import media_cache
+from back.versions import etag_matches
+
+router = APIRouter()
+
+@router.get("/{digest}")
+def get_media(digest: str, request: Request, size: str | None = None, db: Session = Depends(get_db)):
+    """
+    Serve a stored photo. Blobs are content-addressed, so they can be cached forever.
+    Pass ?size=thumb for the thumbnail variant.
+    """
+    entry, thumb = None, False
+    if size == "thumb":
+        # Without Pillow there is no thumbnail, and the full image is sent under its own tag
+        entry = media_cache.get(db, digest)
+        thumb = entry is not None and entry[2] is not None
+    etag = f'"{digest}-thumb"' if thumb else f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    if entry is None:
+        entry = media_cache.get(db, digest)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Media not found")
+    content_type, data, thumbnail = entry
+    if thumb:
+        content_type, data = "image/jpeg", thumbnail
+    return Response(content=data, media_type=content_type, headers=headers)
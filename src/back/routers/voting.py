@@ -1,149 +1,172 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from typing import List
+from pydantic import TypeAdapter
+import asyncio
+import json
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from back.database.database import get_db
-from back.models.models import User, Candidate, Vote, VotingSession
-from back.schemas.schemas import CandidateOut, VotingStatusOut, ResultsOut
+from back.database.database import AsyncDB, get_async_db
+from back.models.models import Candidate, SessionCandidate, Vote
+from back.schemas.schemas import BallotIn, CandidateOut, VotingStatusOut, ResultsOut
 from back.auth.auth import get_current_user
-from collections import defaultdict
+from back.auth.cache import UserSnapshot
 from back.utils import get_title_or_message
+from back import ballots, engine, finalists, invalidation, progress, queries, tally
+from back.active_session import active_sessions, get_session
+from back.scopes import scopes
+from back.versions import data_versions, not_modified
+from back.responses import model_response
+from back.events import broadcaster
+from back.config import VOTE_GROUP_COMMIT
+from back.ingest import vote_ingester
+from back.snapshot import snapshots
+
+# Seconds between keep-alive comments on idle event streams
+STREAM_KEEPALIVE = 15
 
 router = APIRouter()
 
+candidate_list = TypeAdapter(List[CandidateOut])
+results_out = TypeAdapter(ResultsOut)
+
+# Routes are async and hand their database work to db.run(), which runs it on the
+# async engine or in the threadpool depending on ASYNC_DB.
+#
+# The polled GET routes answer If-None-Match with a 304 before touching the
+# snapshot, using an ETag read from back.versions.
+#
+# The router is mounted twice: under /voting, where the routes address the active
+# session, and under /sessions/{session_id}, where session_id is a path parameter
+# so several committees can vote at once. Everything below takes the session id
+# (None for /voting) and resolves it with get_session().
+
 @router.get("/candidates/{stage}", response_model=List[CandidateOut])
-def list_candidates(stage: int = 1, db: Session = Depends(get_db)):
+async def list_candidates(request: Request, response: Response, stage: int = 1, session_id: int | None = None, db: AsyncDB = Depends(get_async_db)):
+    cached = not_modified(request, response, await db.run(_candidates_etag, stage, session_id))
+    if cached is not None:
+        return cached
+    return model_response(candidate_list, await db.run(_list_candidates, stage, session_id), response)
+
+def _ballot_session(db: Session, session_id: int | None):
+    # Stage 1 candidates are listed even without an active session
+    return get_session(db, session_id) if session_id is not None else active_sessions.get(db)
+
+def _candidates_etag(db: Session, stage: int, session_id: int | None):
+    session = _ballot_session(db, session_id) if stage == 1 else get_session(db, session_id)
+    if session is None:
+        return data_versions.etag("candidates")
+    return data_versions.etag("candidates", stage, session.stage, session_id=session.id)
+
+def _list_candidates(db: Session, stage: int, session_id: int | None = None):
     if stage == 1:
+        session = _ballot_session(db, session_id)
+        if session is not None and scopes.get(db, session.id).candidate_ids is not None:
+            return db.query(Candidate).join(SessionCandidate, SessionCandidate.candidate_id == Candidate.id).filter(
+                SessionCandidate.session_id == session.id
+            ).order_by(Candidate.id).all()
         return db.query(Candidate).all()
 
     # For stages 2 and 3, get only the top candidates from previous stage
-    current_session = db.query(VotingSession).filter_by(active=True).first()
-    if not current_session:
-        raise HTTPException(status_code=400, detail="No active voting session")
-
-    # Get results from previous stage
-    prev_stage = stage - 1
-    results = defaultdict(int)
-    for v in db.query(Vote).filter_by(stage=prev_stage, session_id=current_session.id).all():
-        results[v.candidate_id] += v.points
-
-    # Sort by points and get top candidates
-    sorted_results = sorted(results.items(), key=lambda x: x[1], reverse=True)
-
-    # Get top 2 candidates, or 3 if there's a tie for second place
-    top_candidates = []
-    if len(sorted_results) >= 2:
-        top_candidates = [sorted_results[0][0]]  # First place
-        if len(sorted_results) >= 3 and sorted_results[1][1] == sorted_results[2][1]:
-            # If there's a tie for second place, include all tied candidates
-            second_place_points = sorted_results[1][1]
-            for candidate_id, points in sorted_results[1:]:
-                if points == second_place_points:
-                    top_candidates.append(candidate_id)
-                else:
-                    break
-        else:
-            top_candidates.append(sorted_results[1][0])  # Second place
-
-    return db.query(Candidate).filter(Candidate.id.in_(top_candidates)).all()
+    current_session = get_session(db, session_id)
+
+    # Recorded when the session advanced to the stage
+    if current_session.stage >= stage:
+        recorded = finalists.candidates(db, current_session.id, stage)
+        if recorded:
+            return recorded
+
+    # The stage has not been reached yet (or was reached before finalists were
+    # recorded): rank the previous stage's results as they stand
+    results = snapshots.get(db, current_session).points(stage - 1)
+    return db.query(Candidate).filter(Candidate.id.in_(engine.qualify(results))).all()
 
 @router.post("/vote/{candidate_id}/{stage}")
-def vote(candidate_id: int, stage: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # Get current active session
-    current_session = db.query(VotingSession).filter_by(active=True).first()
-    if not current_session:
-        raise HTTPException(status_code=400, detail="No active voting session")
+async def vote(candidate_id: int, stage: int, session_id: int | None = None, current_user: UserSnapshot = Depends(get_current_user), db: AsyncDB = Depends(get_async_db)):
+    return await _cast(db, session_id, [candidate_id], stage, current_user)
 
-    if stage not in [1, 2, 3]:
-        raise HTTPException(status_code=400, detail="Invalid stage")
+@router.post("/ballot/{stage}")
+async def ballot(stage: int, ballot: BallotIn, session_id: int | None = None, current_user: UserSnapshot = Depends(get_current_user), db: AsyncDB = Depends(get_async_db)):
+    """
+    Cast several votes of a stage at once, best first: a whole stage 1 ballot is
+    three candidate ids worth 3, 2 and 1 points. The votes are recorded in one
+    transaction, so either all of them count or none does.
+    """
+    return await _cast(db, session_id, ballot.candidate_ids, stage, current_user)
 
-    # Check if user has already voted 3 times in this stage
-    vote_count = db.query(Vote).filter_by(
-        user_id=current_user.id,
-        stage=stage,
-        session_id=current_session.id
-    ).count()
+async def _cast(db: AsyncDB, session_id: int | None, candidate_ids: list[int], stage: int, current_user: UserSnapshot):
+    if VOTE_GROUP_COMMIT:
+        session_id, points, advanced = await vote_ingester.submit(db, session_id, candidate_ids, stage, current_user)
+    else:
+        session_id, points, advanced = await db.write(_record_votes, session_id, candidate_ids, stage, current_user)
+
+    await invalidation.publish_async("snapshot", session_id)
+    for candidate_id, candidate_points in zip(candidate_ids, points):
+        await broadcaster.publish({
+            "type": "vote",
+            "session_id": session_id,
+            "stage": stage,
+            "candidate_id": candidate_id,
+            "points": candidate_points
+        })
+    if advanced:
+        await invalidation.publish_async("session")
+        await broadcaster.publish({"type": "stage", "session_id": session_id, "stage": stage + 1})
+        return {"message": "Vote recorded. All users have completed voting for this stage. Moving to next stage."}
 
-    if vote_count >= 3 and stage == 1:
-        raise HTTPException(status_code=400, detail="You have already cast all your votes for this stage")
-    elif vote_count >= 1 and stage > 1:
-        raise HTTPException(status_code=400, detail="You have already cast all your votes for this stage")
+    return {"message": "Vote recorded"}
 
-    # Check if candidate exists
-    candidate = db.query(Candidate).filter_by(id=candidate_id).first()
-    if not candidate:
-        raise HTTPException(status_code=404, detail="Candidate not found")
+def _record_votes(db: Session, session_id: int | None, candidate_ids: list[int], stage: int, current_user: UserSnapshot):
+    current_session = ballots.check_session(db, session_id, stage, current_user)
 
-    # Check if the user already voted for the candidate in this stage
-    existing_vote = db.query(Vote).filter_by(
-        user_id=current_user.id,
-        candidate_id=candidate_id,
-        stage=stage,
-        session_id=current_session.id
-    ).first()
-    if existing_vote:
-        raise HTTPException(status_code=400, detail="You have already voted for this candidate in this stage")
+    # Check if user has already cast all their votes in this stage
+    vote_count = queries.user_vote_count(db, current_session.id, stage, current_user.id)
+    votes_remaining = progress.votes_per_user(stage) - vote_count
+    ballots.check_votes(candidate_ids, votes_remaining)
+    ballots.check_candidates(db, current_session.id, candidate_ids)
 
     # Calculate points based on vote order (3, 2, 1)
-    points = 3 - vote_count if stage == 1 else 1
-
-    # Record the vote
-    vote = Vote(
-        user_id=current_user.id,
-        candidate_id=candidate_id,
-        stage=stage,
+    points = [3 - vote_count - i if stage == 1 else 1 for i in range(len(candidate_ids))]
+    ballot = ballots.Ballot(
         session_id=current_session.id,
-        points=points
+        stage=stage,
+        user_id=current_user.id,
+        candidate_ids=candidate_ids,
+        points=points,
+        completes=len(candidate_ids) == votes_remaining
     )
-    db.add(vote)
+    try:
+        advanced = ballots.record(db, [ballot])[0]
+    except IntegrityError:
+        db.rollback()
+        raise ballots.conflict(db, ballot)
     db.commit()
-
-    # Check if all users have completed voting for this stage
-    total_users = db.query(User).filter_by(is_admin=False).count()
-    users_voted = db.query(Vote.user_id).filter_by(
-        stage=stage,
-        session_id=current_session.id
-    ).distinct().count()
-
-    if (users_voted == total_users and ((stage == 1 and vote_count == 2) or (stage > 1 and vote_count == 0))):  # Último voto para este usuario
-        # Verificar si todos los usuarios han emitido todos sus votos
-        total_votes = db.query(Vote).filter_by(
-            stage=stage,
-            session_id=current_session.id
-        ).count()
-
-        if (stage == 1 and total_votes == total_users * 3) or (stage > 1 and total_votes == total_users):  # Todos los usuarios han emitido todos sus votos
-            # Pasar a la siguiente etapa
-            current_session.stage = stage + 1
-            db.commit()
-            return {"message": "Vote recorded. All users have completed voting for this stage. Moving to next stage."}
-
-    return {"message": "Vote recorded"}
+    return current_session.id, points, advanced
 
 @router.get("/results/{stage}", response_model=ResultsOut)
-def results(stage: int, db: Session = Depends(get_db)):
-    # Get current active session
-    current_session = db.query(VotingSession).filter_by(active=True).first()
-    if not current_session:
-        raise HTTPException(status_code=400, detail="No active voting session")
+async def results(stage: int, request: Request, response: Response, session_id: int | None = None, db: AsyncDB = Depends(get_async_db)):
+    session = await db.run(get_session, session_id)
+    cached = not_modified(request, response, data_versions.etag("results", stage, session.stage, session_id=session.id))
+    if cached is not None:
+        return cached
+    return model_response(results_out, await db.run(_results, stage, session.id), response)
+
+def _results(db: Session, stage: int, session_id: int | None = None):
+    current_session = get_session(db, session_id)
 
-    # Get all candidates
-    candidates = db.query(Candidate).all()
-    candidate_dict = {c.id: c for c in candidates}
+    snapshot = snapshots.get(db, current_session)
+    candidate_dict = snapshot.candidates
 
     # Calculate points for current stage
-    current_stage_results = defaultdict(int)
-    for v in db.query(Vote).filter_by(stage=stage, session_id=current_session.id).all():
-        current_stage_results[v.candidate_id] += v.points
+    current_stage_results = snapshot.points(stage)
 
     # Add candidates with 0 points to the results
-    for candidates in list_candidates(stage=stage, db=db):
+    for candidates in _list_candidates(db, stage, current_session.id):
         if candidates.id not in current_stage_results:
             current_stage_results[candidates.id] = 0
 
     # Calculate total points across all stages
-    total_points = defaultdict(int)
-    for v in db.query(Vote).filter_by(session_id=current_session.id).all():
-        total_points[v.candidate_id] += v.points
+    total_points = snapshot.total_points
 
     # Combine results
     results = []
@@ -153,10 +176,10 @@ def results(stage: int, db: Session = Depends(get_db)):
             results.append({
                 "candidate_id": candidate_id,
                 "points": current_stage_results[candidate_id],
-                "name": candidate.name,
-                "photo": candidate.photo,
-                "description": candidate.description,
-                "total_points": total_points[candidate_id]
+                "name": candidate["name"],
+                "photo": candidate["photo"],
+                "description": candidate["description"],
+                "total_points": total_points.get(candidate_id, 0)
             })
 
     # Sort by current stage points
@@ -168,97 +191,66 @@ def results(stage: int, db: Session = Depends(get_db)):
     }
 
 @router.get("/winner")
-def get_winner(db: Session = Depends(get_db)):
+async def get_winner(request: Request, response: Response, session_id: int | None = None, db: AsyncDB = Depends(get_async_db)):
     """
     Calculate and return the final winner based on all stages of voting.
     If there was a tie in stage 2, the president's vote in stage 3 determines the winner.
     """
-    current_session = db.query(VotingSession).filter_by(active=True).first()
-    if not current_session:
-        raise HTTPException(status_code=400, detail="No active voting session")
-
-    # Check if we're in stage 3 or beyond
-    if current_session.stage < 3:
-        raise HTTPException(status_code=400, detail="Voting is not complete yet")
-
-    # Check if there was a tie in stage 2
-    stage2_results = defaultdict(int)
-    for v in db.query(Vote).filter_by(stage=2, session_id=current_session.id).all():
-        stage2_results[v.candidate_id] += v.points
-
-    sorted_stage2 = sorted(stage2_results.items(), key=lambda x: x[1], reverse=True)
-
-    # If there are less than 2 candidates with votes, return the one with votes or an error
-    if len(sorted_stage2) == 0:
-        raise HTTPException(status_code=404, detail="No votes recorded in stage 2")
-    elif len(sorted_stage2) == 1:
-        winner_id = sorted_stage2[0][0]
-    else:
-        # Check if there was a tie between first and second place
-        is_tie = sorted_stage2[0][1] == sorted_stage2[1][1]
-
-        if is_tie:
-            # If there was a tie, check stage 3 for the president's tie-breaking vote
-            stage3_votes = db.query(Vote).filter_by(stage=3, session_id=current_session.id).all()
-            if not stage3_votes:
-                raise HTTPException(status_code=400, detail="Tie detected but no tie-breaker vote found")
-
-            # The president's vote determines the winner
-            winner_id = stage3_votes[0].candidate_id
-        else:
-            # If no tie, the winner is the candidate with the most points in stage 2
-            winner_id = sorted_stage2[0][0]
-
-    # Get the winner's details
-    winner = db.query(Candidate).filter_by(id=winner_id).first()
-    if not winner:
-        raise HTTPException(status_code=404, detail="Winner candidate not found")
-
-    # sum all the points the winner got in all the stages
-    total_points = 0
-    for v in db.query(Vote).filter_by(candidate_id=winner_id, session_id=current_session.id).all():
-        total_points += v.points
+    session = await db.run(get_session, session_id)
+    cached = not_modified(request, response, data_versions.etag("winner", session.stage, session_id=session.id))
+    if cached is not None:
+        return cached
+    return await db.run(_get_winner, session.id)
 
-    return {
-        "candidate_id": winner.id,
-        "name": winner.name,
-        "photo": winner.photo,
-        "description": winner.description,
-        "points": total_points
-    }
+def _get_winner(db: Session, session_id: int | None = None):
+    current_session = get_session(db, session_id)
+
+    return snapshots.get(db, current_session).get_winner()
 
 @router.post("/resolve_tie/{stage}")
-def resolve_tie(stage: int, winner_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def resolve_tie(stage: int, winner_id: int, session_id: int | None = None, current_user: UserSnapshot = Depends(get_current_user), db: AsyncDB = Depends(get_async_db)):
     if not current_user.is_president:
         raise HTTPException(status_code=403, detail="Only the president can resolve ties")
-    tied_votes = db.query(Vote).filter_by(stage=stage).all()
+    session_id = await db.write(_resolve_tie, session_id, stage, winner_id, current_user)
+    await invalidation.publish_async("snapshot", session_id)
+    await broadcaster.publish({
+        "type": "tie_resolved",
+        "session_id": session_id,
+        "stage": stage,
+        "candidate_id": winner_id
+    })
+    return {"message": "Tie resolved by president"}
+
+def _resolve_tie(db: Session, session_id: int | None, stage: int, winner_id: int, current_user: UserSnapshot):
+    current_session = get_session(db, session_id)
+    if not current_session.active:
+        raise HTTPException(status_code=400, detail="This voting session has ended")
+    tied_votes = db.query(Vote).filter_by(stage=stage, session_id=current_session.id).count()
     if not tied_votes:
         raise HTTPException(status_code=404, detail="No votes to resolve")
     # Clear existing votes in tie-breaking round (for simplicity)
-    db.query(Vote).filter_by(stage=stage).delete()
-    db.commit()
-    db.add(Vote(user_id=current_user.id, candidate_id=winner_id, stage=stage))
+    db.query(Vote).filter_by(stage=stage, session_id=current_session.id).delete()
+    tally.clear_stage(db, current_session.id, stage)
+    db.add(Vote(user_id=current_user.id, candidate_id=winner_id, stage=stage, session_id=current_session.id, points=1))
+    tally.add_points(db, current_session.id, stage, winner_id, 1)
+    progress.set_completed(db, current_session.id, stage, 1)
     db.commit()
-    return {"message": "Tie resolved by president"} 
+    return current_session.id
 
 @router.get("/voting_status", response_model=VotingStatusOut)
-def get_voting_status(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_voting_status(session_id: int | None = None, current_user: UserSnapshot = Depends(get_current_user), db: AsyncDB = Depends(get_async_db)):
     """
     Get the current voting status for the user, including title, votes remaining, and tie status.
     """
-    # Get current active session
-    current_session = db.query(VotingSession).filter_by(active=True).first()
-    if not current_session:
-        raise HTTPException(status_code=400, detail="No active voting session")
+    return await db.run(_voting_status, session_id, current_user)
+
+def _voting_status(db: Session, session_id: int | None, current_user: UserSnapshot):
+    current_session = get_session(db, session_id)
 
     current_stage = current_session.stage
 
     # Calculate votes remaining for the user
-    vote_count = db.query(Vote).filter_by(
-        user_id=current_user.id,
-        stage=current_stage,
-        session_id=current_session.id
-    ).count()
+    vote_count = queries.user_vote_count(db, current_session.id, current_stage, current_user.id)
 
     # Calculate votes remaining based on stage
     if current_stage == 1:
@@ -266,29 +258,13 @@ def get_voting_status(current_user: User = Depends(get_current_user), db: Sessio
     else:
         votes_remaining = 1 - vote_count
 
-    # Check for tie in stage 2 if we're in stage 3
+    # The tie flag and winner only apply once stage 2 is over
     is_tie = False
-    if current_stage == 3:
-        # Get results from stage 2
-        stage2_results = defaultdict(int)
-        for v in db.query(Vote).filter_by(stage=2, session_id=current_session.id).all():
-            stage2_results[v.candidate_id] += v.points
-
-        sorted_stage2 = sorted(stage2_results.items(), key=lambda x: x[1], reverse=True)
-
-        # Check if there's a tie between first and second place
-        if len(sorted_stage2) >= 2:
-            is_tie = sorted_stage2[0][1] == sorted_stage2[1][1]
-
-    # Try to get winner if we're in stage 3
     winner = None
     if current_stage == 3:
-        try:
-            winner_data = get_winner(db=db)
-            winner = winner_data
-        except HTTPException:
-            # No winner yet
-            pass
+        snapshot = snapshots.get(db, current_session)
+        is_tie = snapshot.is_tie
+        winner = snapshot.winner
 
     title, waiting_message = get_title_or_message(current_stage, current_user, is_tie, votes_remaining, winner)
 
@@ -300,4 +276,32 @@ def get_voting_status(current_user: User = Depends(get_current_user), db: Sessio
         "winner": winner
     }
 
+@router.get("/stream")
+async def stream(session_id: int | None = None):
+    """
+    Server-sent events for votes, stage changes and tie resolutions, so clients
+    only refresh results and status when something actually changed. Under
+    /sessions/{session_id} only that session's events are sent.
+    """
+    queue = broadcaster.subscribe()
 
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    data = await asyncio.wait_for(queue.get(), timeout=STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if session_id is not None and json.loads(data).get("session_id") != session_id:
+                    continue
+                yield f"data: {data}\n\n"
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
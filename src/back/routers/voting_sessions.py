@@ -1,17 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
 from datetime import datetime
-from back.database.database import get_db
-from back.models.models import VotingSession, Vote
+from back.database.database import AsyncDB, get_async_db
+from back.models.models import VotingSession, Vote, ArchivedVote, StageProgress, Finalist, SessionCandidate, SessionVoter, SessionResult, SessionStats
+from back.schemas.schemas import SessionCreate, SessionMembers, SessionOut
+from back.pagination import page, page_response, parse_fields
+from back.config import ADMIN_PAGE_SIZE, ADMIN_MAX_PAGE_SIZE
+from back import analytics, invalidation, scopes, tally
+from back.events import broadcaster
+from back.active_session import active_sessions, get_session
 
 router = APIRouter()
 
 @router.post("/start_session")
-def start_session(db: Session = Depends(get_db)):
+async def start_session(db: AsyncDB = Depends(get_async_db)):
     """
     Start a new voting session.
     """
-    existing_session = db.query(VotingSession).filter_by(active=True).first()
+    session_id, stage = await db.write(_start_session)
+    await invalidation.publish_async("session")
+    await broadcaster.publish({"type": "session", "session_id": session_id, "active": True, "stage": stage})
+    return {"message": "Voting session started successfully"}
+
+def _start_session(db: Session):
+    existing_session = active_sessions.get(db)
     if existing_session:
         raise HTTPException(status_code=400, detail="Session already exists")
 
@@ -26,44 +38,132 @@ def start_session(db: Session = Depends(get_db)):
     )
     db.add(session)
     db.commit()
-    return {"message": "Voting session started successfully"}
+    return session.id, session.stage
 
 @router.post("/end_session")
-def end_session(db: Session = Depends(get_db)):
+async def end_session(db: AsyncDB = Depends(get_async_db)):
     """
     End the current voting session.
     """
-    session = db.query(VotingSession).filter_by(active=True).first()
+    session_id, stage = await db.write(_end_session)
+    await invalidation.publish_async("session")
+    await broadcaster.publish({"type": "session", "session_id": session_id, "active": False, "stage": stage})
+    return {"message": "Voting session ended successfully"}
+
+def _end_session(db: Session, session_id: int | None = None):
+    query = db.query(VotingSession).filter_by(active=True)
+    if session_id is None:
+        session = query.order_by(VotingSession.id).first()
+    else:
+        session = query.filter_by(id=session_id).first()
     if not session:
         raise HTTPException(status_code=400, detail="No active session to end")
 
     session.active = False
+    # Summarized in the same transaction, for the /analytics routes
+    analytics.summarize(db, session)
+    db.commit()
+    return session.id, session.stage
+
+@router.post("/create_session")
+async def create_session(session_data: SessionCreate, db: AsyncDB = Depends(get_async_db)):
+    """
+    Create a session that runs alongside any active one, e.g. for another committee,
+    optionally limited to some candidates and voters. It is voted through the
+    /sessions/{session_id}/... routes.
+    """
+    session_id, stage = await db.write(_create_session, session_data)
+    await invalidation.publish_async("session")
+    await broadcaster.publish({"type": "session", "session_id": session_id, "active": session_data.active, "stage": stage})
+    return {"message": "Voting session created successfully", "session_id": session_id}
+
+def _create_session(db: Session, session_data: SessionCreate):
+    if db.query(VotingSession).filter_by(name=session_data.name).first():
+        raise HTTPException(status_code=400, detail="Session already exists")
+    session = VotingSession(name=session_data.name, description=session_data.description, active=session_data.active, stage=1)
+    db.add(session)
+    db.flush()
+    if session_data.candidate_ids:
+        scopes.set_candidates(db, session.id, session_data.candidate_ids)
+    if session_data.voter_ids:
+        scopes.set_voters(db, session.id, session_data.voter_ids)
     db.commit()
+    return session.id, session.stage
+
+@router.post("/end_session/{session_id}")
+async def end_session_by_id(session_id: int, db: AsyncDB = Depends(get_async_db)):
+    """
+    End one voting session, leaving the others running.
+    """
+    session_id, stage = await db.write(_end_session, session_id)
+    await invalidation.publish_async("session")
+    await broadcaster.publish({"type": "session", "session_id": session_id, "active": False, "stage": stage})
     return {"message": "Voting session ended successfully"}
 
+@router.put("/{session_id}/candidates")
+async def set_session_candidates(session_id: int, members: SessionMembers, db: AsyncDB = Depends(get_async_db)):
+    """
+    Replace the candidates on a session's ballot. An empty list puts every candidate on it.
+    """
+    await db.write(_set_members, session_id, scopes.set_candidates, members.ids)
+    await invalidation.publish_async("scope", session_id)
+    await invalidation.publish_async("snapshot", session_id)
+    return {"message": "Session candidates updated"}
+
+@router.put("/{session_id}/voters")
+async def set_session_voters(session_id: int, members: SessionMembers, db: AsyncDB = Depends(get_async_db)):
+    """
+    Replace the users who vote in a session. An empty list lets every non-admin user vote.
+    """
+    await db.write(_set_members, session_id, scopes.set_voters, members.ids)
+    await invalidation.publish_async("scope", session_id)
+    await invalidation.publish_async("snapshot", session_id)
+    return {"message": "Session voters updated"}
+
+def _set_members(db: Session, session_id: int, setter, ids: list[int]):
+    if db.get(VotingSession, session_id) is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    setter(db, session_id, ids)
+    db.commit()
+
 @router.get("/current_session")
-def current_session(db: Session = Depends(get_db)):
+async def current_session(db: AsyncDB = Depends(get_async_db)):
     """
     Get the current active voting session.
     """
-    session = db.query(VotingSession).filter_by(active=True).first()
+    session = await db.run(active_sessions.get)
     if not session:
         raise HTTPException(status_code=404, detail="No active session found")
     return session
 
 @router.get("/sessions")
-def get_sessions(db: Session = Depends(get_db)):
+async def get_sessions(request: Request, response: Response, after: int | None = None, limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=ADMIN_MAX_PAGE_SIZE), fields: str | None = None, db: AsyncDB = Depends(get_async_db)):
     """
-    Get all voting sessions.
+    Get the voting sessions by id, paged like /admin/get_candidates.
     """
-    sessions = db.query(VotingSession).all()
-    return sessions
+    selected = parse_fields(SessionOut, fields)
+    sessions = await db.run(page, VotingSession, selected, after, limit)
+    return page_response(request, response, SessionOut, selected, sessions, limit)
+
+@router.get("/{session_id}")
+async def get_voting_session(session_id: int, db: AsyncDB = Depends(get_async_db)):
+    """
+    Get one voting session by ID.
+    """
+    return await db.run(get_session, session_id)
 
 @router.delete("/delete_session/{session_id}")
-def delete_session(session_id: int, db: Session = Depends(get_db)):
+async def delete_session(session_id: int, db: AsyncDB = Depends(get_async_db)):
     """
     Delete a voting session by ID.
     """
+    await db.write(_delete_session, session_id)
+    await invalidation.publish_async("session")
+    await invalidation.publish_async("scope", session_id)
+    await invalidation.publish_async("snapshot", session_id)
+    return {"message": "Voting session deleted successfully"}
+
+def _delete_session(db: Session, session_id: int):
     session = db.query(VotingSession).filter_by(id=session_id).first()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -71,7 +171,14 @@ def delete_session(session_id: int, db: Session = Depends(get_db)):
     votes = db.query(Vote).filter_by(session_id=session.id).count()
     if votes > 0:
         db.query(Vote).filter_by(session_id=session.id).delete()
+    db.query(ArchivedVote).filter_by(session_id=session.id).delete()
+    tally.clear_session(db, session.id)
+    db.query(StageProgress).filter_by(session_id=session.id).delete()
+    db.query(Finalist).filter_by(session_id=session.id).delete()
+    db.query(SessionCandidate).filter_by(session_id=session.id).delete()
+    db.query(SessionVoter).filter_by(session_id=session.id).delete()
+    db.query(SessionResult).filter_by(session_id=session.id).delete()
+    db.query(SessionStats).filter_by(session_id=session.id).delete()
 
     db.delete(session)
     db.commit()
-    return {"message": "Voting session deleted successfully"}
\ No newline at end of file
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 
 class Token(BaseModel):
@@ -45,12 +45,20 @@ class SessionCreate(BaseModel):
     name: str
     description: Optional[str] = None
     active: Optional[bool] = True
+    # Restrict the ballot and the electorate; left out, every candidate / non-admin user
+    candidate_ids: Optional[List[int]] = None
+    voter_ids: Optional[List[int]] = None
+
+# Candidate or voter ids of a session
+class SessionMembers(BaseModel):
+    ids: List[int]
 
 class SessionOut(BaseModel):
     id: int
     name: str
     description: Optional[str] = None
     active: bool
+    stage: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -64,6 +72,10 @@ class UserVotesOut(BaseModel):
     class Config:
         from_attributes = True
 
+# Ordered picks of a ballot, best first (3, 2 and 1 points in stage 1)
+class BallotIn(BaseModel):
+    candidate_ids: List[int] = Field(min_length=1)
+
 class VotingStatusOut(BaseModel):
     title: str
     votes_remaining: int
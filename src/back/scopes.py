@@ -0,0 +1,73 @@
+import threading
+from dataclasses import dataclass
+from sqlalchemy.orm import Session
+from back.models.models import SessionCandidate, SessionVoter, User
+from back import invalidation
+
+
+@dataclass(frozen=True)
+class SessionScope:
+    """
+    Who votes in a session and for whom. None means no restriction: every
+    candidate, or every non-admin user.
+    """
+    candidate_ids: frozenset[int] | None
+    voter_ids: frozenset[int] | None
+
+
+class ScopeCache:
+    """
+    Per-session SessionScope, read on first use and kept until the session's
+    candidates or voters are changed.
+    """
+
+    def __init__(self):
+        self._scopes: dict[int, SessionScope] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, session_id: int) -> SessionScope:
+        with self._lock:
+            scope = self._scopes.get(session_id)
+            generation = self._generation
+        if scope is not None:
+            return scope
+        candidate_ids = frozenset(c for (c,) in db.query(SessionCandidate.candidate_id).filter_by(session_id=session_id))
+        voter_ids = frozenset(u for (u,) in db.query(SessionVoter.user_id).filter_by(session_id=session_id))
+        scope = SessionScope(candidate_ids=candidate_ids or None, voter_ids=voter_ids or None)
+        with self._lock:
+            if generation == self._generation:
+                self._scopes[session_id] = scope
+        return scope
+
+    def invalidate(self, session_id: int | None = None):
+        with self._lock:
+            self._generation += 1
+            if session_id is None:
+                self._scopes.clear()
+            else:
+                self._scopes.pop(session_id, None)
+
+
+scopes = ScopeCache()
+invalidation.register("scope", scopes.invalidate)
+
+
+def eligible_voters(db: Session, session_id: int) -> int:
+    """
+    Number of users who must finish a stage before the session moves on.
+    """
+    scope = scopes.get(db, session_id)
+    if scope.voter_ids is not None:
+        return len(scope.voter_ids)
+    return db.query(User).filter_by(is_admin=False).count()
+
+
+def set_candidates(db: Session, session_id: int, candidate_ids: list[int]):
+    db.query(SessionCandidate).filter_by(session_id=session_id).delete(synchronize_session=False)
+    db.add_all([SessionCandidate(session_id=session_id, candidate_id=c) for c in set(candidate_ids)])
+
+
+def set_voters(db: Session, session_id: int, user_ids: list[int]):
+    db.query(SessionVoter).filter_by(session_id=session_id).delete(synchronize_session=False)
+    db.add_all([SessionVoter(session_id=session_id, user_id=u) for u in set(user_ids)])
@@ -0,0 +1,109 @@
+import time
+from dataclasses import dataclass
+from back import engine
+from back.engine import qualify_mask, tie_mask
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, simulate() says so when it is missing
+    np = None
+
+# Monte Carlo elections under the rules of engine.py, to see how often ties
+# happen and how a change to the rules plays out. Each voter has a taste for
+# each candidate: the candidate's strength, the same for every voter, plus
+# random noise. A voter ranks their favourites in stage 1 and votes for their
+# favourite finalist in stage 2. On a stage 2 tie, the president picks their
+# favourite of the tied candidates.
+
+
+@dataclass
+class Elections:
+    """The votes of a batch of simulated elections, one row per election."""
+    strength: "np.ndarray"  # (candidates,)
+    stage1: "np.ndarray"  # (elections, voters, len(points)): candidate indexes, best first
+    stage2: "np.ndarray"  # (elections, voters): candidate index
+    tiebreak: "np.ndarray"  # (elections,): the president's pick among the tied candidates
+
+
+def _stage_points(choices: "np.ndarray", weights: "np.ndarray", candidates: int) -> "np.ndarray":
+    # One bincount for the whole batch: election e, candidate c is cell e * candidates + c
+    elections = choices.shape[0]
+    cells = (np.arange(elections)[:, None] * candidates + choices.reshape(elections, -1)).ravel()
+    totals = np.bincount(cells, weights=np.broadcast_to(weights, choices.shape).ravel(), minlength=elections * candidates)
+    return totals.astype(np.int64).reshape(elections, candidates)
+
+
+def _favourite(taste: "np.ndarray", allowed: "np.ndarray") -> "np.ndarray":
+    return np.argmax(np.where(allowed, taste, -np.inf), axis=-1)
+
+
+def generate(rng: "np.random.Generator", elections: int, voters: int, strength: "np.ndarray", points=engine.STAGE1_POINTS) -> Elections:
+    """Draw the votes of `elections` elections, stage 2 following from stage 1."""
+    candidates = len(strength)
+    # Strength plus Gumbel noise: ranking by it draws each voter's ranking from a
+    # Plackett-Luce model with weights exp(strength)
+    taste = strength + rng.gumbel(size=(elections, voters, candidates))
+    picks = len(points)
+    best = np.argpartition(-taste, picks - 1, axis=-1)[..., :picks]
+    order = np.argsort(-np.take_along_axis(taste, best, axis=-1), axis=-1)
+    stage1 = np.take_along_axis(best, order, axis=-1)
+
+    finalists = qualify_mask(_stage_points(stage1, np.asarray(points), candidates))
+    stage2 = _favourite(taste, finalists[:, None, :])
+    stage2_points = _stage_points(stage2[..., None], np.ones(1, dtype=np.int64), candidates)
+    tied = stage2_points == stage2_points.max(axis=-1, keepdims=True)
+    tiebreak = _favourite(strength + rng.gumbel(size=(elections, candidates)), tied)
+    return Elections(strength, stage1, stage2, tiebreak)
+
+
+def outcomes(elections: Elections, points=engine.STAGE1_POINTS) -> dict[str, "np.ndarray"]:
+    """Score a batch in one pass: per election, the finalists, whether stage 2 tied and the winner."""
+    candidates = len(elections.strength)
+    stage1_points = _stage_points(elections.stage1, np.asarray(points), candidates)
+    stage2_points = _stage_points(elections.stage2[..., None], np.ones(1, dtype=np.int64), candidates)
+    tie = tie_mask(stage2_points)
+    return {
+        "stage1_points": stage1_points,
+        "finalists": qualify_mask(stage1_points),
+        "tie": tie,
+        "winner": np.where(tie, elections.tiebreak, np.argmax(stage2_points, axis=-1))
+    }
+
+
+def simulate(elections: int, voters: int, candidates: int, points=engine.STAGE1_POINTS, spread: float = 1.0,
+             seed: int | None = None, batch_votes: int = 4_000_000) -> dict:
+    """
+    Run `elections` elections of `voters` voters over `candidates` candidates
+    whose strengths are drawn with standard deviation `spread` (0: all equal), in
+    batches of about `batch_votes` voter-candidate pairs. Returns how often each
+    outcome happened.
+    """
+    engine.require_numpy()
+    if not 1 <= len(points) <= candidates:
+        raise ValueError("Voters must rank at least one candidate, and no more than there are, in stage 1")
+    rng = np.random.default_rng(seed)
+    strength = np.sort(rng.normal(scale=spread, size=candidates))[::-1]
+    batch = max(1, batch_votes // (voters * candidates))
+
+    counts = {"three_or_more_finalists": 0, "stage2_ties": 0, "stage1_leader_wins": 0, "strongest_wins": 0}
+    finalists = 0
+    started = time.perf_counter()
+    for start in range(0, elections, batch):
+        result = outcomes(generate(rng, min(batch, elections - start), voters, strength, points), points)
+        per_election = result["finalists"].sum(axis=-1)
+        finalists += int(per_election.sum())
+        counts["three_or_more_finalists"] += int(np.count_nonzero(per_election >= 3))
+        counts["stage2_ties"] += int(np.count_nonzero(result["tie"]))
+        leaders = result["stage1_points"] == result["stage1_points"].max(axis=-1, keepdims=True)
+        counts["stage1_leader_wins"] += int(np.count_nonzero(np.take_along_axis(leaders, result["winner"][:, None], axis=-1)))
+        # Strengths are sorted, so candidate 0 is the strongest
+        counts["strongest_wins"] += int(np.count_nonzero(result["winner"] == 0))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "elections": elections,
+        "ballots": elections * voters * 2,
+        "seconds": round(elapsed, 3),
+        "mean_finalists": round(finalists / elections, 3),
+        **{name: round(count / elections, 4) for name, count in counts.items()}
+    }
@@ -0,0 +1,122 @@
+import threading
+from dataclasses import dataclass, field
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from back.models.models import Candidate, VotingSession
+from back import engine, invalidation, queries
+
+
+@dataclass(frozen=True)
+class StageSnapshot:
+    """
+    Everything the results, winner and status endpoints derive from the votes of a
+    session, computed in two queries and shared until the next vote or stage change.
+    """
+    session_id: int
+    stage: int
+    stage_points: dict[int, dict[int, int]]  # stage -> candidate_id -> points
+    total_points: dict[int, int]
+    candidates: dict[int, dict]  # candidate_id -> name, photo, description
+    stage2_ranking: list[tuple[int, int]]  # (candidate_id, points), best first
+    is_tie: bool
+    winner: dict | None = None
+    winner_error: HTTPException | None = field(default=None)
+
+    def points(self, stage: int) -> dict[int, int]:
+        return dict(self.stage_points.get(stage, {}))
+
+    def get_winner(self) -> dict:
+        if self.winner_error is not None:
+            raise self.winner_error
+        return self.winner
+
+
+def compute_snapshot(db: Session, session: VotingSession) -> StageSnapshot:
+    stage_points = queries.session_points(db, session.id)
+    total_points: dict[int, int] = {}
+    for points in stage_points.values():
+        for candidate_id, value in points.items():
+            total_points[candidate_id] = total_points.get(candidate_id, 0) + value
+    candidates = {
+        c.id: {"name": c.name, "photo": c.photo, "description": c.description}
+        for c in db.query(Candidate).all()
+    }
+
+    # Check if there was a tie in stage 2
+    stage2_ranking = engine.rank(stage_points.get(2, {}))
+    is_tie = engine.is_tie(stage2_ranking)
+
+    winner, winner_error = None, None
+    if session.stage < 3:
+        winner_error = HTTPException(status_code=400, detail="Voting is not complete yet")
+    elif len(stage2_ranking) == 0:
+        winner_error = HTTPException(status_code=404, detail="No votes recorded in stage 2")
+    else:
+        # On a tie, the president's vote in stage 3 determines the winner
+        winner_id = engine.winner(stage2_ranking, stage_points.get(3, {}))
+        if winner_id is None:
+            winner_error = HTTPException(status_code=400, detail="Tie detected but no tie-breaker vote found")
+        else:
+            candidate = candidates.get(winner_id)
+            if candidate is None:
+                winner_error = HTTPException(status_code=404, detail="Winner candidate not found")
+            else:
+                winner = {
+                    "candidate_id": winner_id,
+                    "name": candidate["name"],
+                    "photo": candidate["photo"],
+                    "description": candidate["description"],
+                    "points": total_points.get(winner_id, 0)
+                }
+
+    return StageSnapshot(
+        session_id=session.id,
+        stage=session.stage,
+        stage_points=stage_points,
+        total_points=total_points,
+        candidates=candidates,
+        stage2_ranking=stage2_ranking,
+        is_tie=is_tie,
+        winner=winner,
+        winner_error=winner_error
+    )
+
+
+class SnapshotCache:
+    """
+    Per-session StageSnapshot, rebuilt lazily after the writers invalidate it.
+    """
+
+    def __init__(self):
+        self._snapshots: dict[int, StageSnapshot] = {}
+        # Bumped on every invalidation, so a snapshot computed from data read before
+        # a concurrent write is not stored over the invalidation.
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, session: VotingSession) -> StageSnapshot:
+        with self._lock:
+            snapshot = self._snapshots.get(session.id)
+            generation = self._generation
+        if snapshot is not None and snapshot.stage == session.stage:
+            return snapshot
+        snapshot = compute_snapshot(db, session)
+        with self._lock:
+            if generation == self._generation:
+                self._snapshots[session.id] = snapshot
+        return snapshot
+
+    def invalidate(self, session_id: int | None = None):
+        """
+        Drop the snapshot of one session, or of every session (e.g. when candidates change).
+        """
+        with self._lock:
+            self._generation += 1
+            if session_id is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(session_id, None)
+
+
+snapshots = SnapshotCache()
+invalidation.register("snapshot", snapshots.invalidate)
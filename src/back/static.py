@@ -0,0 +1,152 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, without it only .gz variants are built
+    brotli = None
+
+# Pre-built variants, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+COMPRESSIBLE = {".html", ".js", ".css", ".json", ".map", ".svg", ".txt", ".ico", ".xml", ".webmanifest"}
+# The build puts content-hashed file names under static/, which never change
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+def accepted_encodings(header: str) -> set[str]:
+    """The content codings an Accept-Encoding header allows (q > 0)."""
+    encodings = set()
+    for item in header.split(","):
+        name, _, params = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip() and quality > 0:
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+class FrontendFiles(StaticFiles):
+    """
+    The frontend build. Files are sent as their pre-built .br or .gz variant when
+    the client accepts it, with ranges and 304s handled by Starlette, and hashed
+    files under static/ are cached for good. Any other path gets index.html, kept
+    in memory, so client-side routes work.
+    """
+
+    def __init__(self, directory: str):
+        super().__init__(directory=directory)
+        self.root = os.path.realpath(directory)
+        # The build does not change while the server runs, so variants are looked up once per file
+        self._variants: dict[str, list[tuple[str, str, os.stat_result]]] = {}
+        self._index = self._load_index()
+
+    def _load_index(self) -> dict[str | None, bytes]:
+        path = os.path.join(self.root, "index.html")
+        with open(path, "rb") as f:
+            index = {None: f.read()}
+        for encoding, suffix in ENCODINGS:
+            if os.path.exists(path + suffix):
+                with open(path + suffix, "rb") as f:
+                    index[encoding] = f.read()
+        if "gzip" not in index:
+            index["gzip"] = gzip.compress(index[None], mtime=0)
+        self._index_etag = hashlib.sha256(index[None]).hexdigest()[:16]
+        return index
+
+    def _variants_of(self, full_path: str) -> list[tuple[str, str, os.stat_result]]:
+        variants = self._variants.get(full_path)
+        if variants is None:
+            variants = []
+            for encoding, suffix in ENCODINGS:
+                try:
+                    variants.append((encoding, full_path + suffix, os.stat(full_path + suffix)))
+                except OSError:
+                    pass
+            self._variants[full_path] = variants
+        return variants
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+        variants = self._variants_of(str(full_path))
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        encoding = None
+        for candidate, path, variant_stat in variants:
+            if candidate in accepted:
+                encoding, full_path, stat_result = candidate, path, variant_stat
+                break
+
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, media_type=media_type)
+        if encoding is not None:
+            # Otherwise CompressionMiddleware sees the response and adds the Vary header itself
+            response.headers["Content-Encoding"] = encoding
+            response.headers["Vary"] = "Accept-Encoding"
+        hashed = os.path.relpath(str(full_path), self.root).startswith("static" + os.sep)
+        response.headers["Cache-Control"] = IMMUTABLE if hashed else REVALIDATE
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def index_response(self, scope: Scope) -> Response:
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        encoding = next((encoding for encoding, _ in ENCODINGS if encoding in accepted and encoding in self._index), None)
+        headers = {
+            "ETag": f'"{self._index_etag}-{encoding or "identity"}"',
+            "Cache-Control": REVALIDATE,
+            "Vary": "Accept-Encoding"
+        }
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        response = Response(self._index[encoding], media_type="text/html", headers=headers)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        try:
+            return await super().get_response(path, scope)
+        except HTTPException as e:
+            # A missing build file or API path is a real 404, not a client-side route
+            if e.status_code != 404 or path.startswith(("static/", "api/")):
+                raise
+            return self.index_response(scope)
+
+
+def compress_assets(directory: str, minimum_size: int) -> int:
+    """
+    Write a .gz (and with brotli installed, a .br) next to every compressible
+    file of a build that is at least `minimum_size` bytes, when it is smaller.
+    Returns the number of files written.
+    """
+    written = 0
+    for folder, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(folder, name)
+            if os.path.splitext(name)[1] not in COMPRESSIBLE or os.path.getsize(path) < minimum_size:
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            variants = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                variants[".br"] = brotli.compress(data, quality=11)
+            for suffix, compressed in variants.items():
+                if len(compressed) < len(data):
+                    with open(path + suffix, "wb") as f:
+                        f.write(compressed)
+                    written += 1
+    return written
@@ -0,0 +1,109 @@
+from sqlalchemy import func, insert, select, union_all
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from back.config import USE_TALLY_TABLE
+from back.models.models import ArchivedVote, Tally, Vote
+
+
+def add_points(db: Session, session_id: int, stage: int, candidate_id: int, points: int):
+    """
+    Add points to the running tally of a candidate. Must be called in the same
+    transaction as the Vote insert so both commit (or roll back) together.
+    """
+    if not USE_TALLY_TABLE:
+        return
+    tally = db.query(Tally).filter_by(session_id=session_id, stage=stage, candidate_id=candidate_id)
+    if tally.update({Tally.points: Tally.points + points}, synchronize_session=False):
+        return
+    try:
+        with db.begin_nested():
+            db.add(Tally(session_id=session_id, stage=stage, candidate_id=candidate_id, points=points))
+    except IntegrityError:
+        # The candidate's first points were recorded concurrently by another request
+        tally.update({Tally.points: Tally.points + points}, synchronize_session=False)
+
+
+def stage_points(db: Session, session_id: int, stage: int) -> dict[int, int]:
+    """
+    Points per candidate for a single stage, in the order candidates first received votes.
+    """
+    rows = db.query(Tally.candidate_id, Tally.points).filter_by(
+        session_id=session_id,
+        stage=stage
+    ).order_by(Tally.id).all()
+    return {candidate_id: points for candidate_id, points in rows}
+
+
+def session_points(db: Session, session_id: int) -> dict[int, dict[int, int]]:
+    """
+    Points per candidate for every stage of a session, keyed by stage.
+    """
+    stages: dict[int, dict[int, int]] = {}
+    rows = db.query(Tally.stage, Tally.candidate_id, Tally.points).filter_by(
+        session_id=session_id
+    ).order_by(Tally.id).all()
+    for stage, candidate_id, points in rows:
+        stages.setdefault(stage, {})[candidate_id] = points
+    return stages
+
+
+def total_points(db: Session, session_id: int) -> dict[int, int]:
+    """
+    Points per candidate summed across every stage of a session.
+    """
+    rows = db.query(Tally.candidate_id, func.sum(Tally.points)).filter_by(
+        session_id=session_id
+    ).group_by(Tally.candidate_id).all()
+    return {candidate_id: int(points) for candidate_id, points in rows}
+
+
+def candidate_points(db: Session, session_id: int, candidate_id: int) -> int:
+    """
+    Points a single candidate got across every stage of a session.
+    """
+    points = db.query(func.sum(Tally.points)).filter_by(
+        session_id=session_id,
+        candidate_id=candidate_id
+    ).scalar()
+    return int(points or 0)
+
+
+def clear_stage(db: Session, session_id: int, stage: int):
+    db.query(Tally).filter_by(session_id=session_id, stage=stage).delete(synchronize_session=False)
+
+
+def clear_session(db: Session, session_id: int):
+    db.query(Tally).filter_by(session_id=session_id).delete(synchronize_session=False)
+
+
+def rebuild(db: Session, session_id: int | None = None):
+    """
+    Recompute the tally from the raw votes, archived ones included, for one session
+    or for all of them.
+    """
+    sources = []
+    for table in (Vote, ArchivedVote):
+        source = select(table.id, table.session_id, table.stage, table.candidate_id, table.points)
+        source = source.where(table.session_id.is_not(None))
+        if session_id is not None:
+            source = source.where(table.session_id == session_id)
+        sources.append(source)
+    every_vote = union_all(*sources).subquery()
+    votes = select(
+        every_vote.c.session_id,
+        every_vote.c.stage,
+        every_vote.c.candidate_id,
+        func.sum(every_vote.c.points)
+    ).group_by(
+        every_vote.c.session_id, every_vote.c.stage, every_vote.c.candidate_id
+    ).order_by(func.min(every_vote.c.id))
+
+    tallies = db.query(Tally)
+    if session_id is not None:
+        tallies = tallies.filter_by(session_id=session_id)
+    tallies.delete(synchronize_session=False)
+    db.execute(insert(Tally).from_select(
+        [Tally.session_id, Tally.stage, Tally.candidate_id, Tally.points],
+        votes
+    ))
+    db.commit()
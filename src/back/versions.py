@@ -0,0 +1,70 @@
+import secrets
+import threading
+from fastapi import Request, Response
+from back import invalidation
+
+
+class DataVersions:
+    """
+    Counters bumped whenever a session's votes or the candidates change, from which
+    the polled endpoints build their ETags.
+
+    They follow the "snapshot" invalidations, so every worker bumps them on every
+    write, but their values only mean something within one process: tags also carry
+    a random per-process epoch, so a tag issued by another worker (or before a
+    restart) never matches and just costs a full response.
+    """
+
+    def __init__(self):
+        self.epoch = secrets.token_hex(4)
+        self._candidates = 0
+        self._sessions: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self, session_id: int | None = None):
+        with self._lock:
+            if session_id is None:
+                # Candidates changed, which shows in every session
+                self._candidates += 1
+            else:
+                self._sessions[session_id] = self._sessions.get(session_id, 0) + 1
+
+    def etag(self, *parts, session_id: int | None = None) -> str:
+        """
+        A strong ETag for data identified by `parts`, that changes with the candidates
+        and, if given, the votes of `session_id`. Read it before the data it describes,
+        so a write racing with the read leaves the client with an outdated tag rather
+        than a current tag on outdated data.
+        """
+        with self._lock:
+            version = [self._candidates]
+            if session_id is not None:
+                version += [session_id, self._sessions.get(session_id, 0)]
+        return '"' + "-".join(str(part) for part in (self.epoch, *version, *parts)) + '"'
+
+
+data_versions = DataVersions()
+invalidation.register("snapshot", data_versions.invalidate)
+
+
+def not_modified(request: Request, response: Response, etag: str) -> Response | None:
+    """
+    Tag the response with `etag` and, if the client already holds it, return the 304
+    to send instead of computing the body.
+    """
+    response.headers["ETag"] = etag
+    # Let clients keep the body but revalidate it on every poll
+    response.headers["Cache-Control"] = "no-cache"
+
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return None
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match (a list, weak tags or `*`) holds `etag`."""
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
@@ -22,6 +22,28 @@ apiClient.interceptors.request.use((config) => {
     return Promise.reject(error);
 });
 
+// Photos are served from /media on the API; older records may still hold inline data URLs
+export const mediaUrl = (photo: string | null | undefined, size?: 'thumb') => {
+    if (!photo || !photo.startsWith('/media/')) {
+        return photo || undefined;
+    }
+    return `${API_BASE}${photo}${size ? `?size=${size}` : ''}`;
+};
+
+// The admin lists are paged: follow the Link rel="next" header through every page,
+// asking only for the fields the admin screens show
+const fetchAllPages = async <T,>(url: string, fields: string[]) => {
+    const data: T[] = [];
+    let next: string | null = `${url}?limit=1000&fields=${fields.join(',')}`;
+    while (next) {
+        const response: { data: T[], headers: any } = await apiClient.get<T[]>(next);
+        data.push(...response.data);
+        const link = /<([^>]+)>;\s*rel="next"/.exec(response.headers.link || '');
+        next = link ? link[1] : null;
+    }
+    return { data };
+};
+
 // Auth
 export const login = (username: string, password: string) =>
     apiClient.post<TokenResponse>('/token', new URLSearchParams({ username, password }));
@@ -31,17 +53,17 @@ export const fetchCurrentUser = () => apiClient.get<User>('/users/me');
 
 // Admin actions
 export const addCandidate = (name: string, photo: string, description: string) => apiClient.post<Candidate>('/admin/add_candidate', { name, photo, description });
-export const fetchCandidatesList = () => apiClient.get<Candidate[]>('/admin/get_candidates');
+export const fetchCandidatesList = () => fetchAllPages<Candidate>('/admin/get_candidates', ['name', 'photo', 'description']);
 export const removeCandidate = (candidateId: number) => apiClient.delete(`/admin/remove_candidate/${candidateId}`);
 export const addUser = (username: string, password: string, is_president: boolean) => apiClient.post<User>('/admin/add_user', { username, password, is_president });
-export const fetchUsers = () => apiClient.get<User[]>('/admin/get_users');
+export const fetchUsers = () => fetchAllPages<User>('/admin/get_users', ['username', 'is_president', 'is_admin']);
 export const removeUser = (userId: number) => apiClient.delete(`/admin/remove_user/${userId}`);
 
 // Voting sessions
 export const startVotingSession = () => apiClient.post<{ message: string }>('/voting_sessions/start_session');
 export const endVotingSession = () => apiClient.post<{ message: string }>('/voting_sessions/end_session');
 export const getCurrentVotingSession = () => apiClient.get<VotingSession>('/voting_sessions/current_session');
-export const getAllVotingSessions = () => apiClient.get<VotingSession[]>('/voting_sessions/sessions');
+export const getAllVotingSessions = () => fetchAllPages<VotingSession>('/voting_sessions/sessions', ['name', 'description', 'active', 'stage']);
 export const deleteVotingSession = (sessionId: number) => apiClient.delete(`/voting_sessions/delete_session/${sessionId}`);
 
 // Voting actions
@@ -57,4 +79,7 @@ export const fetchVotingStatus = () => apiClient.get<{
 
 export const fetchResults = (stage: number) => apiClient.get<Result>(`/voting/results/${stage}`);
 
+// Server-sent events pushed whenever a vote is recorded, a stage advances or a tie is resolved
+export const openVotingStream = () => new EventSource(`${API_BASE}/voting/stream`);
+
 export default apiClient; 
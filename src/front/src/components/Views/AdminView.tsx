@@ -308,7 +308,7 @@ export default function AdminView() {
                             {candidates.map((candidate: types.Candidate) => (
                                 <AdminCandidateCard
                                     key={candidate.id}
-                                    photo={candidate.photo}
+                                    photo={api.mediaUrl(candidate.photo, 'thumb') || ''}
                                     name={candidate.name}
                                     description={candidate.description}
                                     onRemove={() => handleRemoveCandidate(candidate.id)}
@@ -48,7 +48,7 @@ export default function ResultsView({ currentStage, setShowResults }: ResultsVie
           <div key={result.candidate_id} className="results-card">
             <div className="results-card-content">
               <img
-                src={result.photo || '/default-photo.png'}
+                src={api.mediaUrl(result.photo) || '/default-photo.png'}
                 alt={`${result.name}`}
                 className="results-photo"
               />
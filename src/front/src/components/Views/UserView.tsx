@@ -130,12 +130,27 @@ export default function UserView({ currentUser }: UserViewProps) {
 
   useEffect(() => {
     let pollInterval: NodeJS.Timeout;
+    let stream: EventSource | undefined;
 
     if (isPolling) {
-      pollInterval = setInterval(pollVotingStatus, 1000); // Check every 3 seconds
+      // Refresh only when the server reports a change; fall back to polling if the stream fails
+      stream = api.openVotingStream();
+      stream.onmessage = (event) => {
+        // Other users' votes don't change what a waiting voter sees until the stage advances,
+        // except for the president's tie-breaking vote in Round 3
+        const data = JSON.parse(event.data);
+        if (data.type !== 'vote' || data.stage === 3) {
+          pollVotingStatus();
+        }
+      };
+      stream.onerror = () => {
+        stream?.close();
+        pollInterval = setInterval(pollVotingStatus, 1000);
+      };
     }
 
     return () => {
+      stream?.close();
       if (pollInterval) {
         clearInterval(pollInterval);
       }
@@ -221,7 +236,7 @@ export default function UserView({ currentUser }: UserViewProps) {
       {winner && (
         <div className="user-winner-card">
           <img
-            src={winner.photo}
+            src={api.mediaUrl(winner.photo)}
             alt={`${winner.name}'s photo`}
             className="user-winner-photo"
           />
@@ -258,7 +273,7 @@ export default function UserView({ currentUser }: UserViewProps) {
               >
                 <div className="user-card-content">
                   <img
-                    src={candidate.photo}
+                    src={api.mediaUrl(candidate.photo)}
                     alt={`${candidate.name}'s photo`}
                     className="user-photo"
                   />
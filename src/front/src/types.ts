@@ -13,7 +13,7 @@ export type User = {
   username: string;
   is_president: boolean;
   is_admin: boolean;
-  hashed_password: string;
+  photo?: string | null;
 };
 
 export interface StageResult {
@@ -39,6 +39,6 @@ export type VotingSession = {
     id: number;
     name: string;
     description: string;
-    is_active: boolean;
+    active: boolean;
     stage: number;
 }
\ No newline at end of file
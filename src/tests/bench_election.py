@@ -0,0 +1,263 @@
+"""
+Election benchmark.
+
+Boots the app in-process with uvicorn against a fresh database and plays a whole
+election over HTTP:
+
+  - N voters log in through /token
+  - each voter fetches the stage 1 candidates and casts three ranked votes (one
+    request each, or a single /voting/ballot request with --ballot)
+  - each voter fetches the finalists and casts one stage 2 vote, split evenly
+    between the first two finalists so the stage ends in a tie
+  - the president breaks the tie with a stage 3 vote and the winner is fetched
+
+while M spectators poll /voting/results/{stage} and /voting/voting_status the
+whole time. It reports throughput and, per endpoint, the p50/p95/p99 latency and
+the SQL statements executed per request (read from the Server-Timing header),
+so regressions in back/routers/voting.py show up as numbers.
+
+Each backend runs in its own process, as the engine is configured at import.
+Without --postgres only SQLite (a temporary database) is benchmarked. The
+Postgres database is dropped and recreated, so point it at a scratch database.
+
+Usage:
+    python src/tests/bench_election.py --voters 100 --spectators 8
+    python src/tests/bench_election.py --postgres postgresql://postgres@localhost/fcr_bench
+"""
+import argparse
+import collections
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ORIGINAL_ENV = dict(os.environ)
+TMP_DIR = tempfile.mkdtemp()
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", f"sqlite:///{os.path.join(TMP_DIR, 'bench.db')}")
+os.environ["SERVER_TIMING"] = "true"
+
+import uvicorn  # noqa: E402
+from back.auth.hashing import get_password_hash  # noqa: E402
+from back.database.database import Base, SessionLocal, engine  # noqa: E402
+from back.models.models import Candidate, User, VotingSession  # noqa: E402
+
+CANDIDATES = 10
+PASSWORD = "bench"
+
+# Statement count in the Server-Timing header added by back.metrics
+QUERY_COUNT = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = collections.defaultdict(list)
+        self.queries = collections.defaultdict(list)
+        self.errors = collections.Counter()
+
+    def record(self, label, response, elapsed):
+        with self.lock:
+            self.latencies[label].append(elapsed)
+            match = QUERY_COUNT.search(response.headers.get("server-timing", ""))
+            self.queries[label].append(int(match.group(1)) if match else 0)
+            if response.status_code >= 400:
+                self.errors[label] += 1
+
+
+class Client:
+    """One simulated browser: a keep-alive HTTP session and its bearer token."""
+
+    def __init__(self, base, stats):
+        self.base = base
+        self.stats = stats
+        self.http = requests.Session()
+
+    def call(self, method, label, path, **kwargs):
+        sent = time.perf_counter()
+        response = self.http.request(method, self.base + path, **kwargs)
+        self.stats.record(f"{method} {label}", response, time.perf_counter() - sent)
+        return response
+
+    def login(self, username):
+        response = self.call("POST", "/token", "/token", data={"username": username, "password": PASSWORD})
+        response.raise_for_status()
+        self.http.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+    def candidates(self, stage):
+        response = self.call("GET", "/voting/candidates/{stage}", f"/voting/candidates/{stage}")
+        response.raise_for_status()
+        return [c["id"] for c in response.json()]
+
+    def vote(self, candidate_id, stage):
+        response = self.call("POST", "/voting/vote/{candidate_id}/{stage}", f"/voting/vote/{candidate_id}/{stage}")
+        response.raise_for_status()
+
+    def ballot(self, candidate_ids, stage):
+        response = self.call("POST", "/voting/ballot/{stage}", f"/voting/ballot/{stage}", json={"candidate_ids": candidate_ids})
+        response.raise_for_status()
+
+
+def seed(voters):
+    db = SessionLocal()
+    hashed = get_password_hash(PASSWORD)
+    db.add_all([Candidate(name=f"Bench Candidate {i}") for i in range(CANDIDATES)])
+    db.add(User(username="bench_president", hashed_password=hashed, is_president=True))
+    db.add_all([User(username=f"bench{i}", hashed_password=hashed) for i in range(voters - 1)])
+    db.add(User(username="bench_spectator", hashed_password=hashed, is_admin=True))
+    db.add(VotingSession(name=f"Bench_{time.time()}", active=True, stage=1))
+    db.commit()
+    db.close()
+    return ["bench_president"] + [f"bench{i}" for i in range(voters - 1)]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app, port):
+    # Voters sit idle on their keep-alive connections while the others log in, and
+    # requests hangs on a connection the server has closed in the meantime
+    server = uvicorn.Server(uvicorn.Config(app, port=port, log_level="warning", timeout_keep_alive=600))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            sys.exit("The server did not start")
+        time.sleep(0.05)
+    return server, thread
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def report(stats, elapsed):
+    total = sum(len(v) for v in stats.latencies.values())
+    print(f"{total} requests in {elapsed:.2f}s ({total / elapsed:.0f}/s)")
+    print(f"{'endpoint':<45}{'count':>7}{'errors':>7}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}")
+    for label in sorted(stats.latencies):
+        latencies = stats.latencies[label]
+        queries = stats.queries[label]
+        print(f"{label:<45}{len(latencies):>7}{stats.errors[label]:>7}{len(latencies) / elapsed:>8.0f}"
+              + "".join(f"{1000 * percentile(latencies, f):>9.1f}" for f in (0.5, 0.95, 0.99))
+              + f"{sum(queries) / len(queries):>9.1f}")
+
+
+def run(args):
+    Base.metadata.create_all(bind=engine)
+    if args.reset:
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+    usernames = seed(args.voters)
+
+    # Imported after seeding: importing the app creates the tables and the admin user
+    from back.main import app
+
+    port = free_port()
+    server, thread = start_server(app, port)
+    base = f"http://127.0.0.1:{port}"
+    stats = Stats()
+    done = threading.Event()
+
+    def spectate():
+        client = Client(base, stats)
+        client.login("bench_spectator")
+        while not done.is_set():
+            for stage in (1, 2):
+                client.call("GET", "/voting/results/{stage}", f"/voting/results/{stage}")
+            client.call("GET", "/voting/voting_status", "/voting/voting_status")
+            time.sleep(args.poll_interval)
+
+    phases = {}
+    start = time.perf_counter()
+    spectators = [threading.Thread(target=spectate, daemon=True) for _ in range(args.spectators)]
+    for spectator in spectators:
+        spectator.start()
+
+    clients = [Client(base, stats) for _ in usernames]
+
+    def stage1(index):
+        # Three ranked votes, rotated per voter so the points are spread out
+        candidates = clients[index].candidates(1)
+        picks = [candidates[(index + offset) % len(candidates)] for offset in range(3)]
+        if args.ballot:
+            clients[index].ballot(picks, 1)
+        else:
+            for candidate_id in picks:
+                clients[index].vote(candidate_id, 1)
+
+    def stage2(index):
+        # Alternate between the first two finalists: a tie when the number of voters is even
+        finalists = clients[index].candidates(2)
+        clients[index].vote(finalists[index % 2], 2)
+
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        for phase, fn in (("login", lambda i: clients[i].login(usernames[i])), ("stage 1", stage1), ("stage 2", stage2)):
+            phase_start = time.perf_counter()
+            list(pool.map(fn, range(len(clients))))
+            phases[phase] = time.perf_counter() - phase_start
+
+    phase_start = time.perf_counter()
+    president = clients[0]
+    status = president.call("GET", "/voting/voting_status", "/voting/voting_status").json()
+    if status["is_tie"]:
+        president.vote(president.candidates(3)[0], 3)
+    winner = president.call("GET", "/voting/winner", "/voting/winner")
+    phases["tie-break"] = time.perf_counter() - phase_start
+    elapsed = time.perf_counter() - start
+
+    done.set()
+    for spectator in spectators:
+        spectator.join()
+    server.should_exit = True
+    thread.join()
+
+    print(f"{args.voters} voters, {args.spectators} spectators, tie: {status['is_tie']}, winner: {winner.json()}")
+    print("phases:", ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in phases.items()))
+    report(stats, elapsed)
+    if winner.status_code != 200:
+        sys.exit("FAILED: no winner")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--voters", type=int, default=100, help="voters, the president included")
+    parser.add_argument("--spectators", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=32, help="voters acting at once")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="seconds between a spectator's polls")
+    parser.add_argument("--ballot", action="store_true", help="cast the stage 1 votes with one /voting/ballot request")
+    parser.add_argument("--reset", action="store_true", help="drop and recreate every table first")
+    parser.add_argument("--postgres", metavar="URL", help="also benchmark this (scratch) Postgres database")
+    args = parser.parse_args()
+
+    if args.postgres is None:
+        run(args)
+        return
+
+    command = [sys.executable, __file__, "--voters", str(args.voters), "--spectators", str(args.spectators),
+               "--threads", str(args.threads), "--poll-interval", str(args.poll_interval)]
+    if args.ballot:
+        command.append("--ballot")
+    failed = False
+    for name, url, reset in (("sqlite", None, args.reset), ("postgres", args.postgres, True)):
+        print(f"--- {name}", flush=True)
+        env = {**ORIGINAL_ENV}
+        env.pop("SQLALCHEMY_DATABASE_URL", None)
+        if url:
+            env["SQLALCHEMY_DATABASE_URL"] = url
+        failed |= subprocess.run(command + (["--reset"] if reset else []), env=env).returncode != 0
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark serializing a results payload to the response body.
+
+A results response for N candidates (photo URLs and a short description each)
+is turned into JSON bytes the ways the app has done it:
+
+  - fastapi:   validate against ResultsOut, dump to dicts, then stdlib json.dumps
+               (FastAPI's default path for a route with a response_model)
+  - orjson:    the same, rendered by ORJSONResponse
+  - model:     back.responses.model_response, pydantic validating and writing
+               the JSON bytes in one pass
+
+and the body size is reported plain and gzipped.
+
+Usage:
+    python src/tests/bench_serialization.py
+    python src/tests/bench_serialization.py --candidates 200 --iterations 5000
+"""
+import argparse
+import asyncio
+import gzip
+import statistics
+import time
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from back.responses import model_response
+from back.routers.voting import results_out
+from back.schemas.schemas import ResultsOut
+
+
+def payload(candidates):
+    return {
+        "current_stage": 1,
+        "results": [{
+            "candidate_id": i,
+            "points": 600 - 7 * i,
+            "name": f"Candidate {i}",
+            "photo": f"/media/{i:064x}",
+            "description": "Volunteer coordinator at the foundation since 2015.",
+            "total_points": 600 - 7 * i
+        } for i in range(candidates)]
+    }
+
+
+def timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        body = fn()
+        samples.append(time.perf_counter() - start)
+    return body, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidates", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    data = payload(args.candidates)
+    field = create_model_field(name="Response_results", type_=ResultsOut, mode="serialization")
+    loop = asyncio.new_event_loop()
+
+    def fastapi_default(response_class):
+        return lambda: response_class(loop.run_until_complete(serialize_response(field=field, response_content=data))).body
+
+    variants = {
+        "fastapi": fastapi_default(JSONResponse),
+        "orjson": fastapi_default(ORJSONResponse),
+        "model": lambda: model_response(results_out, data).body,
+    }
+
+    print(f"results payload with {args.candidates} candidates, {args.iterations} iterations")
+    print(f"{'variant':<10}{'median us':>11}{'p95 us':>9}{'bytes':>8}{'gzip':>7}")
+    for name, fn in variants.items():
+        body, samples = timed(fn, args.iterations)
+        p95 = sorted(samples)[int(len(samples) * 0.95)]
+        print(f"{name:<10}{1e6 * statistics.median(samples):>11.1f}{1e6 * p95:>9.1f}{len(body):>8}{len(gzip.compress(body)):>7}")
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark the vectorized tally engine against the per-row loop.
+
+Simulated elections (see back/simulation.py) are scored three ways:
+
+  - loop:     sum each vote row into per-stage dicts in Python, then apply
+              engine.qualify / rank / is_tie / winner, as the app does
+  - score:    engine.score() on each session's vote arrays, one session at a time
+  - batch:    every election at once, one bincount and one qualify_mask
+
+and the finalists, stage 2 ties and winners of the three are checked to agree.
+Then a single session with --session-votes votes is scored with the loop and
+with score().
+
+Usage:
+    python src/tests/bench_tally_engine.py
+    python src/tests/bench_tally_engine.py --elections 20000 --voters 100 --candidates 12
+    python src/tests/bench_tally_engine.py --session-votes 10000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from back import engine, simulation
+
+
+def vote_rows(elections: simulation.Elections, points) -> list[list[tuple[int, int, int]]]:
+    """Per election, its (stage, candidate_id, points) rows, as stored in the votes table."""
+    sessions = []
+    for e in range(elections.stage1.shape[0]):
+        rows = [(1, int(c), p) for ballot in elections.stage1[e] for c, p in zip(ballot, points)]
+        rows += [(2, int(c), 1) for c in elections.stage2[e]]
+        sessions.append(rows)
+    return sessions
+
+
+def loop(sessions, tiebreaks):
+    results = []
+    for rows, tiebreak in zip(sessions, tiebreaks):
+        stage_points = {1: {}, 2: {}}
+        for stage, candidate_id, points in rows:
+            stage_points[stage][candidate_id] = stage_points[stage].get(candidate_id, 0) + points
+        ranking = engine.rank(stage_points[2])
+        results.append((
+            set(engine.qualify(stage_points[1])),
+            engine.is_tie(ranking),
+            engine.winner(ranking, {tiebreak: 1})
+        ))
+    return results
+
+
+def score(arrays, tiebreaks):
+    results = []
+    for (stages, candidates, points), tiebreak in zip(arrays, tiebreaks):
+        # The president's stage 3 vote, counted only when stage 2 is tied
+        scores = engine.score(np.append(stages, 3), np.append(candidates, tiebreak), np.append(points, 1))
+        results.append((set(scores.finalists[2]), scores.is_tie, scores.winner))
+    return results
+
+
+def as_results(outcome):
+    return [
+        ({int(c) for c in np.flatnonzero(finalists)}, bool(tie), int(winner))
+        for finalists, tie, winner in zip(outcome["finalists"], outcome["tie"], outcome["winner"])
+    ]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--elections", type=int, default=5000)
+    parser.add_argument("--voters", type=int, default=30)
+    parser.add_argument("--candidates", type=int, default=8)
+    parser.add_argument("--session-votes", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    points = engine.STAGE1_POINTS
+    rng = np.random.default_rng(args.seed)
+    strength = np.sort(rng.normal(size=args.candidates))[::-1]
+    elections = simulation.generate(rng, args.elections, args.voters, strength, points)
+    sessions = vote_rows(elections, points)
+    arrays = [tuple(np.array(column) for column in zip(*rows)) for rows in sessions]
+    tiebreaks = [int(t) for t in elections.tiebreak]
+    votes = sum(len(rows) for rows in sessions)
+
+    timings = {}
+    timings["loop"], expected = timed(loop, sessions, tiebreaks)
+    timings["score"], scored = timed(score, arrays, tiebreaks)
+    timings["batch"], outcome = timed(simulation.outcomes, elections, points)
+    batched = as_results(outcome)
+
+    print(f"{args.elections} elections, {votes} votes")
+    print(f"{'method':<8}{'seconds':>10}{'votes/s':>14}{'speedup':>9}")
+    for name, seconds in timings.items():
+        print(f"{name:<8}{seconds:>10.3f}{votes / seconds:>14,.0f}{timings['loop'] / seconds:>8.1f}x")
+    mismatches = sum(a != b or a != c for a, b, c in zip(expected, scored, batched))
+    print("OK: all methods agree" if mismatches == 0 else f"FAILED: {mismatches} elections differ")
+
+    # One large session: three stage 1 votes and a stage 2 vote per voter
+    election = simulation.generate(rng, 1, max(1, args.session_votes // 4), strength, points)
+    rows = vote_rows(election, points)
+    columns = [tuple(np.array(column) for column in zip(*rows[0]))]
+    tiebreak = [int(election.tiebreak[0])]
+    loop_seconds, (expected,) = timed(loop, rows, tiebreak)
+    score_seconds, (scored,) = timed(score, columns, tiebreak)
+    print(f"one session, {len(rows[0])} votes: loop {loop_seconds:.3f}s, score {score_seconds:.3f}s "
+          f"({loop_seconds / score_seconds:.1f}x), {'agree' if expected == scored else 'DIFFER'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""
+Concurrent vote load test.
+
+Boots the app with uvicorn in a separate process against a fresh database,
+creates N voters and fires all of their stage 1 votes at once from a thread
+pool, every vote submitted twice to provoke races. Afterwards it checks that:
+
+  - every voter has exactly three stage 1 votes, for distinct candidates, worth 3, 2 and 1 points
+  - the tally table matches the raw votes
+  - the stage completion counter equals the number of voters
+  - the session advanced to stage 2 exactly once
+
+It also reports request latencies, the server's connection pool usage and the
+most threads its process ran at once.
+
+Usage:
+    python src/tests/load_votes.py --voters 1000 --threads 64
+    SQLALCHEMY_DATABASE_URL=postgresql://... python src/tests/load_votes.py --reset
+    python src/tests/load_votes.py --compare   # ASYNC_DB=false vs ASYNC_DB=true
+    python src/tests/load_votes.py --compare-group-commit --voters 2000 --threads 256
+"""
+import argparse
+import collections
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ORIGINAL_ENV = dict(os.environ)
+TMP_DIR = tempfile.mkdtemp()
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", f"sqlite:///{os.path.join(TMP_DIR, 'load.db')}")
+
+from sqlalchemy import func  # noqa: E402
+from back.auth.auth import create_access_token  # noqa: E402
+from back.auth.hashing import get_password_hash  # noqa: E402
+from back.database.database import Base, SessionLocal, engine  # noqa: E402
+from back.models.models import Candidate, StageProgress, Tally, User, Vote, VotingSession  # noqa: E402
+
+CANDIDATES = 10
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def seed(voters):
+    db = SessionLocal()
+    hashed = get_password_hash("load")
+    db.add_all([Candidate(name=f"Load Candidate {i}") for i in range(CANDIDATES)])
+    db.add_all([User(username=f"load{i}", hashed_password=hashed) for i in range(voters)])
+    db.query(VotingSession).filter_by(active=True).update({VotingSession.active: False})
+    session = VotingSession(name=f"Load_{time.time()}", active=True, stage=1)
+    db.add(session)
+    db.commit()
+    candidate_ids = [c.id for c in db.query(Candidate).all()]
+    users = [(u.id, u.username) for u in db.query(User).filter(User.username.like("load%")).all()]
+    session_id = session.id
+    db.close()
+    return session_id, candidate_ids, users
+
+
+def start_server(port):
+    # A separate process, so the load generator's threads do not compete with the
+    # server for the GIL
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "back.main:app", "--port", str(port), "--log-level", "warning"],
+        env=os.environ
+    )
+    while True:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/voting_sessions/current_session", timeout=1)
+            return server
+        except requests.ConnectionError:
+            if server.poll() is not None:
+                sys.exit("The server did not start")
+            time.sleep(0.1)
+
+
+def thread_count(pid):
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("Threads:"):
+                return int(line.split()[1])
+    return 0
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def compare(args, variable):
+    """
+    Run the load test with `variable` off, then on, each in its own process (and,
+    unless SQLALCHEMY_DATABASE_URL is set, its own fresh SQLite database).
+    """
+    for mode in ("false", "true"):
+        print(f"--- {variable}={mode}", flush=True)
+        command = [sys.executable, __file__, "--voters", str(args.voters), "--threads", str(args.threads)]
+        if args.reset:
+            command.append("--reset")
+        subprocess.run(command, env={**ORIGINAL_ENV, variable: mode}, check=False)
+
+
+def check(session_id, voters):
+    db = SessionLocal()
+    failures = []
+
+    per_user = collections.defaultdict(list)
+    for user_id, candidate_id, points in db.query(Vote.user_id, Vote.candidate_id, Vote.points).filter_by(session_id=session_id, stage=1):
+        per_user[user_id].append((candidate_id, points))
+    for user_id, votes in per_user.items():
+        if sorted(p for _, p in votes) != [1, 2, 3] or len({c for c, _ in votes}) != 3:
+            failures.append(f"user {user_id} has votes {votes}")
+    if len(per_user) != voters:
+        failures.append(f"{len(per_user)} voters have votes, expected {voters}")
+
+    raw = dict(db.query(Vote.candidate_id, func.sum(Vote.points)).filter_by(session_id=session_id, stage=1).group_by(Vote.candidate_id).all())
+    tallied = dict(db.query(Tally.candidate_id, Tally.points).filter_by(session_id=session_id, stage=1).all())
+    if raw != tallied:
+        failures.append(f"tally {tallied} does not match votes {raw}")
+
+    progress = db.query(StageProgress.completed).filter_by(session_id=session_id, stage=1).scalar()
+    if progress != voters:
+        failures.append(f"stage progress is {progress}, expected {voters}")
+
+    stage = db.query(VotingSession.stage).filter_by(id=session_id).scalar()
+    if stage != 2:
+        failures.append(f"session is on stage {stage}, expected 2")
+    db.close()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--voters", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--reset", action="store_true", help="drop and recreate every table first")
+    parser.add_argument("--compare", action="store_true", help="run with ASYNC_DB=false, then ASYNC_DB=true")
+    parser.add_argument("--compare-group-commit", action="store_true", help="run with VOTE_GROUP_COMMIT=false, then true")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args, "ASYNC_DB")
+        return
+    if args.compare_group_commit:
+        compare(args, "VOTE_GROUP_COMMIT")
+        return
+    Base.metadata.create_all(bind=engine)
+    if args.reset:
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+
+    session_id, candidate_ids, users = seed(args.voters)
+    port = free_port()
+    server = start_server(port)
+    base = f"http://127.0.0.1:{port}"
+
+    # Each voter's three picks, each submitted twice, all shuffled together
+    tasks = []
+    for user_id, username in users:
+        token = create_access_token({"sub": username})
+        for candidate_id in random.sample(candidate_ids, 3):
+            tasks += [(token, candidate_id)] * 2
+    random.shuffle(tasks)
+
+    local = threading.local()
+    statuses = collections.Counter()
+    latencies = []
+    lock = threading.Lock()
+
+    def submit(task):
+        token, candidate_id = task
+        if not hasattr(local, "http"):
+            local.http = requests.Session()
+        while True:
+            sent = time.perf_counter()
+            response = local.http.post(f"{base}/voting/vote/{candidate_id}/1", headers={"Authorization": f"Bearer {token}"})
+            with lock:
+                statuses[response.status_code] += 1
+                latencies.append(time.perf_counter() - sent)
+            # 409: another vote of the same user won the race for these points, try again
+            if response.status_code != 409:
+                return
+
+    # Threads of the server process (Linux only)
+    thread_peak = 0
+    done = threading.Event()
+
+    def sample_threads():
+        nonlocal thread_peak
+        while not done.wait(0.05):
+            thread_peak = max(thread_peak, thread_count(server.pid))
+
+    sampler = threading.Thread(target=sample_threads, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(submit, tasks))
+    elapsed = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    pool = requests.get(f"{base}/admin/db_pool").json()
+    server.terminate()
+    server.wait()
+
+    print(f"{len(tasks)} vote submissions from {args.voters} voters in {elapsed:.2f}s ({len(tasks) / elapsed:.0f}/s)")
+    print("responses:", dict(sorted(statuses.items())))
+    print("latency ms: p50 %.1f, p95 %.1f, p99 %.1f" % tuple(1000 * percentile(latencies, f) for f in (0.5, 0.95, 0.99)))
+    print("server threads:", thread_peak)
+    print("db pool:", pool)
+    failures = check(session_id, args.voters)
+    for failure in failures[:20]:
+        print("FAIL:", failure)
+    print("FAILED" if failures else "OK: all invariants hold")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()